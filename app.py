@@ -5,9 +5,11 @@ A Streamlit app for AI-powered balance sheet reconciliation.
 
 import streamlit as st
 import pandas as pd
-from anthropic import Anthropic
+import io
 import os
+import time
 from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
 # Import our custom modules
 import processor
@@ -16,6 +18,7 @@ import outputs
 import reconciliation
 import session_manager
 import gl_chat
+import claude_client
 
 
 # Page configuration
@@ -46,13 +49,23 @@ def check_api_key():
         return None
 
 
-def call_claude(prompt: str, api_key: str, max_tokens: int = 16384) -> str:
-    """Call Claude API with the given prompt using streaming for large responses."""
+def call_claude(prompt: Union[str, List[Dict]], api_key: str, max_tokens: int = 16384,
+                on_chunk: Optional[Callable[[int], None]] = None) -> str:
+    """
+    Call Claude API with the given prompt using streaming for large responses.
+    The prompt may be a plain string or a list of content blocks (e.g. from
+    prompts.to_cached_content) carrying cache_control markers.
+    If on_chunk is given, it is called with the number of characters received
+    so far after every streamed chunk, so callers can render progress.
+    """
     try:
-        client = Anthropic(api_key=api_key)
+        client = claude_client.get_client(api_key)
 
-        # Use streaming for responses that might take a while
-        full_response = ""
+        # Use streaming for responses that might take a while.
+        # Collect chunks in a list and join once - repeated string
+        # concatenation copies the whole buffer on every token.
+        chunks = []
+        received = 0
 
         with client.messages.stream(
             model="claude-sonnet-4-5-20250929",
@@ -63,15 +76,89 @@ def call_claude(prompt: str, api_key: str, max_tokens: int = 16384) -> str:
             }]
         ) as stream:
             for text in stream.text_stream:
-                full_response += text
+                chunks.append(text)
+                if on_chunk:
+                    received += len(text)
+                    on_chunk(received)
 
-        return full_response
+        return "".join(chunks)
 
     except Exception as e:
         st.error(f"Error calling Claude API: {str(e)}")
         return None
 
 
+@st.cache_resource(ttl=3600, show_spinner=False)
+def run_session_cleanup() -> float:
+    """
+    Delete expired session files and GL chat overflow files.
+    Cached as a resource with a one-hour TTL, so the directory scan runs once
+    per process per hour instead of on every Streamlit rerun.
+    Returns the time the cleanup ran.
+    """
+    try:
+        session_manager.cleanup_old_sessions(days=7)
+        gl_chat.cleanup_chat_overflow(hours=24)
+    except Exception:
+        pass  # Silently fail if cleanup fails
+    return time.time()
+
+
+@st.cache_data(show_spinner=False)
+def parse_trial_balance_cached(tb_bytes: bytes, tb_name: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Parse and clean an uploaded Trial Balance, memoized on the raw file bytes.
+    Re-analyzing the same upload skips the Excel/CSV parse entirely.
+    Returns (parsed, cleaned) DataFrames.
+    """
+    tb_buffer = io.BytesIO(tb_bytes)
+    tb_buffer.name = tb_name  # parse_trial_balance picks Excel vs CSV from the name
+    tb_df = processor.parse_trial_balance(tb_buffer)
+    return tb_df, processor.clean_data(tb_df)
+
+
+@st.cache_data(show_spinner=False)
+def load_default_mapping(path: str, mtime: float) -> pd.DataFrame:
+    """
+    Load the default category mapping file once and reuse it across reruns.
+    The file's mtime is part of the cache key so edits to the file invalidate it.
+    """
+    with open(path, 'rb') as f:
+        return processor.load_category_mapping(f)
+
+
+@st.cache_data(show_spinner=False)
+def build_classification_excel(classification_df: pd.DataFrame) -> bytes:
+    """Build the Output A Excel file, memoized on the DataFrame contents."""
+    return outputs.create_classification_excel_from_df(classification_df, as_bytes=True)
+
+
+# Status markers shown in the on-screen table (replaces per-cell Styler backgrounds)
+STATUS_MARKERS = {'PASS': '✅ PASS', 'MISMATCH': '❌ MISMATCH'}
+NUMBER_COLUMNS = ['Debit', 'Credit', 'Amount']
+
+
+@st.cache_data(show_spinner=False)
+def build_classification_display(classification_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Prepare the Output A table for display, memoized on the DataFrame contents.
+    Numeric columns stay numeric (formatted by st.dataframe's column_config)
+    and Status gets a ✅/❌ marker, so no Styler HTML is rendered per cell.
+    """
+    display_df = classification_df.copy()
+
+    for col in NUMBER_COLUMNS:
+        if col in display_df.columns:
+            # Whole dollars, as the old '{:,.0f}' text showed; "localized" drops the decimals then
+            display_df[col] = pd.to_numeric(display_df[col], errors='coerce').round(0)
+
+    if 'Status' in display_df.columns:
+        status = display_df['Status'].astype(str).str.strip().str.upper()
+        display_df['Status'] = status.map(STATUS_MARKERS).fillna(display_df['Status'])
+
+    return display_df
+
+
 def main():
     # Initialize session state for persisting results
     if 'analysis_complete' not in st.session_state:
@@ -108,11 +195,8 @@ def main():
             pass
         st.session_state.session_auto_loaded = True
 
-    # Cleanup old sessions (run once on app load)
-    try:
-        session_manager.cleanup_old_sessions(days=7)
-    except Exception:
-        pass  # Silently fail if cleanup fails
+    # Cleanup old sessions (at most once an hour per server process, not on every rerun)
+    run_session_cleanup()
 
     # Header
     st.title("📊 Balance Sheet Buddy")
@@ -148,6 +232,15 @@ def main():
 
         st.markdown("---")
 
+        # Claude is only needed for commentary and unmapped accounts
+        use_ai_commentary = st.checkbox(
+            "🧠 Include Claude commentary",
+            value=True,
+            help="When unchecked and every account is mapped, PASS/MISMATCH is computed locally without calling Claude"
+        )
+
+        st.markdown("---")
+
         # Info about reconciliation
         st.info("💡 **GL files** are uploaded per account in the **Account Reconciliation** tab")
 
@@ -236,11 +329,11 @@ def main():
                 try:
                     # Step 1: Parse Trial Balance
                     with st.status("📊 Parsing Trial Balance...", expanded=True) as status:
-                        tb_df = processor.parse_trial_balance(tb_file)
+                        # Parsed and cleaned frames are cached on the file contents
+                        tb_df, tb_df_clean = parse_trial_balance_cached(tb_file.getvalue(), tb_file.name)
                         st.write(f"✓ Loaded {len(tb_df)} accounts")
 
                         # Clean data
-                        tb_df_clean = processor.clean_data(tb_df)
                         removed = len(tb_df) - len(tb_df_clean)
                         st.write(f"✓ Removed {removed} blank/total rows")
                         st.write(f"✓ {len(tb_df_clean)} accounts ready for analysis")
@@ -253,8 +346,9 @@ def main():
                             mapping_df = processor.load_category_mapping(mapping_file)
                             st.write(f"✓ Loaded {len(mapping_df)} category mappings from uploaded file")
                         elif use_default_mapping:
-                            with open(default_mapping_path, 'rb') as f:
-                                mapping_df = processor.load_category_mapping(f)
+                            mapping_df = load_default_mapping(
+                                default_mapping_path, os.path.getmtime(default_mapping_path)
+                            )
                             st.write(f"✓ Loaded {len(mapping_df)} category mappings from default file")
                         else:
                             mapping_df = pd.DataFrame({
@@ -266,7 +360,7 @@ def main():
 
                         # Merge with trial balance
                         tb_merged = processor.merge_with_mapping(tb_df_clean, mapping_df)
-                        mapped_count = len(tb_merged[tb_merged['Category'] != 'Unmapped'])
+                        mapped_count = int(tb_merged['Category'].ne('Unmapped').sum())
                         st.write(f"✓ Mapped {mapped_count}/{len(tb_merged)} accounts")
 
                         status.update(label="✓ Category mapping applied", state="complete")
@@ -277,28 +371,44 @@ def main():
                         st.write(f"✓ Formatted {len(tb_merged)} accounts for analysis")
                         status.update(label="✓ Data formatted", state="complete")
 
-                    # Step 4: Call Claude for Output A
-                    with st.status("🧠 Analyzing with Claude AI (Output A)...", expanded=True) as status:
-                        prompt = prompts.generate_output_a_prompt(tb_text)
-
-                        # Calculate max_tokens based on account count (roughly 100 tokens per account + overhead)
-                        estimated_tokens = max(16384, len(tb_merged) * 100 + 2000)
-                        estimated_tokens = min(estimated_tokens, 32000)  # Cap at model limit
-                        st.write(f"✓ Using {estimated_tokens} max tokens for {len(tb_merged)} accounts")
-                        st.write("⏳ Streaming response from Claude (this may take 30-60 seconds)...")
-
-                        classification_result = call_claude(prompt, api_key, max_tokens=estimated_tokens)
-
-                        if classification_result:
-                            st.write("✓ Classification analysis complete")
-                            status.update(label="✓ Output A generated", state="complete")
-                        else:
-                            st.error("Failed to get analysis from Claude")
-                            st.stop()
+                    # Step 4: Call Claude for Output A - skipped when the mapping covers every
+                    # account and no commentary is requested, since the framework rules are applied locally
+                    needs_llm = use_ai_commentary or mapped_count < len(tb_merged)
+                    if needs_llm:
+                        with st.status("🧠 Analyzing with Claude AI (Output A)...", expanded=True) as status:
+                            # One cache breakpoint after the framework + TB prefix; only the task tail varies
+                            prompt = prompts.to_cached_content(prompts.generate_output_a_prompt_parts(tb_text))
+
+                            # Calculate max_tokens based on account count (roughly 100 tokens per account + overhead)
+                            estimated_tokens = max(16384, len(tb_merged) * 100 + 2000)
+                            estimated_tokens = min(estimated_tokens, 32000)  # Cap at model limit
+                            st.write(f"✓ Using {estimated_tokens} max tokens for {len(tb_merged)} accounts")
+                            st.write("⏳ Streaming response from Claude (this may take 30-60 seconds)...")
+
+                            stream_progress = st.empty()
+                            classification_result = call_claude(
+                                prompt,
+                                api_key,
+                                max_tokens=estimated_tokens,
+                                on_chunk=lambda received: stream_progress.text(f"📡 Received {received:,} characters...")
+                            )
+                            stream_progress.empty()
+
+                            if classification_result:
+                                st.write("✓ Classification analysis complete")
+                                status.update(label="✓ Output A generated", state="complete")
+                            else:
+                                st.error("Failed to get analysis from Claude")
+                                st.stop()
+                    else:
+                        classification_result = "(Local classification - all accounts mapped, Claude not called)"
+                        with st.status("⚡ Classifying locally (all accounts mapped)...", expanded=True) as status:
+                            st.write("✓ Skipped Claude - PASS/MISMATCH inferred from category mapping")
+                            status.update(label="✓ Output A generated locally", state="complete")
 
                     # Step 5: Parse classification results into DataFrame
                     with st.status("📋 Parsing classification results...", expanded=True) as status:
-                        classification_df = outputs.parse_claude_table_response(classification_result)
+                        classification_df = outputs.parse_claude_table_response(classification_result) if needs_llm else pd.DataFrame()
 
                         # Check if parsing was successful AND Status column has actual values
                         has_valid_status = (not classification_df.empty and
@@ -307,74 +417,41 @@ def main():
 
                         if has_valid_status:
                             st.write(f"✓ Parsed {len(classification_df)} accounts from Claude response")
-                            # Merge with tb_merged to get Debit, Credit, Amount columns
-                            # Match on Account column
-                            classification_df = tb_merged.merge(
-                                classification_df[['Account', 'Status', 'Balance_Type', 'Commentary'] if 'Commentary' in classification_df.columns else ['Account', 'Status', 'Balance_Type']],
-                                on='Account',
-                                how='left'
-                            )
+                            # Align Claude's columns onto tb_merged (keeps Debit, Credit, Amount)
+                            # by Account lookup - no full-frame merge
+                            parsed_cols = [col for col in ['Status', 'Balance_Type', 'Commentary'] if col in classification_df.columns]
+                            parsed = classification_df.drop_duplicates('Account').set_index('Account')[parsed_cols]
+                            aligned = parsed.reindex(tb_merged['Account'])
+                            classification_df = tb_merged.copy()
+                            for col in parsed_cols:
+                                classification_df[col] = aligned[col].to_numpy()
                             # Fill missing Status with inferred values
-                            if classification_df['Status'].isna().any():
-                                def infer_status(row):
-                                    if pd.notna(row.get('Status')):
-                                        return row['Status']
-                                    category = str(row.get('Category', '')).lower()
-                                    balance_type = 'Debit' if row['Debit'] > 0 else 'Credit' if row['Credit'] > 0 else 'Zero'
-                                    if 'asset' in category and 'contra' not in category:
-                                        return 'PASS' if balance_type == 'Debit' else 'MISMATCH'
-                                    elif 'liability' in category or 'equity' in category:
-                                        return 'PASS' if balance_type == 'Credit' else 'MISMATCH'
-                                    elif 'clearing' in category:
-                                        return 'PASS' if balance_type == 'Zero' else 'MISMATCH'
-                                    else:
-                                        return 'PASS'
-                                classification_df['Status'] = classification_df.apply(infer_status, axis=1)
+                            missing_status = classification_df['Status'].isna()
+                            if missing_status.any():
+                                classification_df.loc[missing_status, 'Status'] = processor.infer_status(
+                                    classification_df[missing_status]
+                                )
                         else:
-                            st.write("⚠️ Claude response not in table format or Status column empty - using trial balance with inferred status")
+                            if needs_llm:
+                                st.write("⚠️ Claude response not in table format or Status column empty - using trial balance with inferred status")
                             # Use trial balance and infer basic status
                             classification_df = tb_merged.copy()
 
                             # Infer basic PASS/MISMATCH based on balance type
-                            def infer_status(row):
-                                category = str(row.get('Category', '')).lower()
-                                balance_type = 'Debit' if row['Debit'] > 0 else 'Credit' if row['Credit'] > 0 else 'Zero'
-
-                                # Basic validation rules
-                                if 'asset' in category and 'contra' not in category:
-                                    return 'PASS' if balance_type == 'Debit' else 'MISMATCH'
-                                elif 'liability' in category or 'equity' in category:
-                                    return 'PASS' if balance_type == 'Credit' else 'MISMATCH'
-                                elif 'clearing' in category:
-                                    return 'PASS' if balance_type == 'Zero' else 'MISMATCH'
-                                else:
-                                    return 'PASS'  # Default for unmapped
-
-                            classification_df['Status'] = classification_df.apply(infer_status, axis=1)
-                            classification_df['Balance_Type'] = classification_df.apply(
-                                lambda row: 'Debit' if row['Debit'] > 0 else 'Credit' if row['Credit'] > 0 else 'Zero',
-                                axis=1
-                            )
-                            classification_df['Amount'] = classification_df.apply(
-                                lambda row: row['Debit'] if row['Debit'] > 0 else row['Credit'],
-                                axis=1
-                            )
+                            balance_types = processor.get_balance_types(classification_df)
+                            classification_df['Status'] = processor.infer_status(classification_df, balance_types)
+                            classification_df['Balance_Type'] = balance_types
+                            classification_df['Amount'] = processor.get_balance_amounts(classification_df)
 
                         # Ensure required columns exist even if parsed successfully
                         if 'Balance_Type' not in classification_df.columns:
-                            classification_df['Balance_Type'] = classification_df.apply(
-                                lambda row: 'Debit' if row['Debit'] > 0 else 'Credit' if row['Credit'] > 0 else 'Zero',
-                                axis=1
-                            )
+                            classification_df['Balance_Type'] = processor.get_balance_types(classification_df)
                         if 'Amount' not in classification_df.columns:
-                            classification_df['Amount'] = classification_df.apply(
-                                lambda row: row['Debit'] if row['Debit'] > 0 else row['Credit'],
-                                axis=1
-                            )
+                            classification_df['Amount'] = processor.get_balance_amounts(classification_df)
 
                         # Generate Excel using the same DataFrame that will be displayed
                         # This ensures Excel matches what user sees on screen
-                        excel_output = outputs.create_classification_excel_from_df(classification_df)
+                        excel_output = build_classification_excel(classification_df)
                         st.write("✓ Excel file created")
                         status.update(label="✓ Classification parsed", state="complete")
 
@@ -413,8 +490,8 @@ def main():
                 st.download_button(
                     label="📥 Download Backup",
                     data=session_bytes,
-                    file_name=f"BSBuddy_Session_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                    mime="application/json",
+                    file_name=f"BSBuddy_Session_{datetime.now().strftime('%Y%m%d_%H%M%S')}{session_manager.SESSION_EXT}",
+                    mime="application/octet-stream",
                     width='stretch',
                     help="Download a backup copy of your session (auto-save is already active)"
                 )
@@ -460,49 +537,19 @@ def main():
                 # Display classification results as table
                 st.markdown("#### Classification Results")
                 if st.session_state.classification_df is not None and not st.session_state.classification_df.empty:
-                    # Format the dataframe for display
-                    display_df = st.session_state.classification_df.copy()
+                    # Display frame is memoized on the DataFrame contents,
+                    # so tab switches and download clicks don't re-format the whole table
+                    display_df = build_classification_display(st.session_state.classification_df)
 
-                    # Format numerical columns with commas, no decimals
-                    def format_number(value):
-                        """Format number with thousand separators, no decimals."""
-                        try:
-                            num = float(value)
-                            return f"{num:,.0f}"
-                        except (ValueError, TypeError):
-                            return value
-
-                    # Apply formatting to numerical columns
-                    for col in ['Debit', 'Credit', 'Amount']:
-                        if col in display_df.columns:
-                            display_df[col] = display_df[col].apply(format_number)
-
-                    # Color code based on status
-                    def highlight_status(row):
-                        if 'Status' in row and isinstance(row['Status'], str):
-                            if row['Status'].upper() == 'PASS':
-                                return ['background-color: #d4edda'] * len(row)
-                            elif row['Status'].upper() == 'MISMATCH':
-                                return ['background-color: #f8d7da'] * len(row)
-                        return [''] * len(row)
-
-                    # Apply styling: colors and right-align numerical columns
-                    styled_df = display_df.style.apply(highlight_status, axis=1)
-
-                    # Right-align numerical columns (Debit, Credit, Amount)
-                    align_dict = {}
-                    for col in ['Debit', 'Credit', 'Amount']:
-                        if col in display_df.columns:
-                            align_dict[col] = 'text-align: right'
-
-                    if align_dict:
-                        styled_df = styled_df.set_properties(subset=list(align_dict.keys()), **{'text-align': 'right'})
-
-                    # Display with styling - large height to show many rows
+                    # Numbers are right-aligned with thousand separators by the grid itself
                     st.dataframe(
-                        styled_df,
+                        display_df,
                         width='stretch',
-                        height=600  # Scrollable table
+                        height=600,  # Scrollable table
+                        column_config={
+                            col: st.column_config.NumberColumn(col, format="localized")
+                            for col in NUMBER_COLUMNS if col in display_df.columns
+                        }
                     )
                 else:
                     st.info("Classification table could not be parsed. Download Excel file for full results.")
@@ -4,6 +4,16 @@ Simple authentication for Balance Sheet Buddy.
 
 import streamlit as st
 import hashlib
+import hmac
+
+
+@st.cache_resource
+def _correct_password_hash() -> bytes:
+    """
+    SHA-256 digest of APP_PASSWORD, computed once per process.
+    Raises KeyError if the secret is not configured.
+    """
+    return hashlib.sha256(st.secrets["APP_PASSWORD"].encode()).digest()
 
 
 def check_password():
@@ -44,10 +54,10 @@ def check_password():
         if login_button:
             # Get the correct password hash from secrets
             try:
-                correct_password = st.secrets["APP_PASSWORD"]
+                correct_hash = _correct_password_hash()
 
-                # Check password
-                if password == correct_password:
+                # Check password (constant-time digest comparison)
+                if hmac.compare_digest(hashlib.sha256(password.encode()).digest(), correct_hash):
                     st.session_state.password_correct = True
                     st.success("✅ Login successful!")
                     st.rerun()
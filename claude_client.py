@@ -0,0 +1,241 @@
+"""
+Claude Client Module
+Shared Anthropic client for Balance Sheet Buddy.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterator
+
+import httpx
+import streamlit as st
+import anthropic
+from anthropic import Anthropic, AsyncAnthropic, DefaultAsyncHttpxClient, DefaultHttpxClient
+
+# Connection pool shared by every Anthropic client; HTTP/2 multiplexes concurrent
+# requests over one TLS connection
+HTTP_LIMITS = httpx.Limits(max_connections=10, max_keepalive_connections=10)
+
+
+@st.cache_resource
+def _shared_http_client() -> httpx.Client:
+    """One HTTP/2 httpx client for the process (auth is per request, so keys can share it)."""
+    return DefaultHttpxClient(http2=True, limits=HTTP_LIMITS)
+
+
+@st.cache_resource
+def get_client(api_key: str) -> Anthropic:
+    """
+    Return a cached Anthropic client for the given API key.
+    Streamlit reruns the whole script on every interaction, so the client
+    is built once per process and reused; all clients share one HTTP/2 pool.
+    """
+    return Anthropic(api_key=api_key, http_client=_shared_http_client())
+
+
+def new_async_client(api_key: str) -> AsyncAnthropic:
+    """
+    Build an AsyncAnthropic client on its own HTTP/2 pool.
+    Async clients are bound to the event loop they run on, so callers create one
+    per asyncio.run and close it afterwards.
+    """
+    return AsyncAnthropic(api_key=api_key, http_client=DefaultAsyncHttpxClient(http2=True, limits=HTTP_LIMITS))
+
+
+# Default Anthropic budget the limiter starts from: requests and tokens per minute,
+# and the cap on concurrent requests
+ANTHROPIC_RPM = 50
+ANTHROPIC_TPM = 80_000
+ANTHROPIC_MAX_CONCURRENCY = 5
+MAX_RETRIES = 3
+IMAGE_TOKEN_ESTIMATE = 1600
+
+
+class RateLimiter:
+    """
+    Proactive client-side limiter for Anthropic calls.
+    Requests wait for room in one-minute RPM/TPM windows and for a concurrency slot.
+    The concurrency limit follows AIMD: +1 after each success (up to the cap),
+    halved after each rate-limit rejection.
+    """
+
+    def __init__(self, rpm: int = ANTHROPIC_RPM, tpm: int = ANTHROPIC_TPM,
+                 max_concurrency: int = ANTHROPIC_MAX_CONCURRENCY):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency
+        self.concurrency = float(max_concurrency)
+        self.in_flight = 0
+        self.window = deque()  # (submit time, estimated tokens)
+        self.lock = threading.Lock()
+
+    def try_acquire(self, tokens: int) -> float:
+        """Take a slot for a request of `tokens`; returns 0 on success, else seconds to wait."""
+        with self.lock:
+            now = time.monotonic()
+            while self.window and now - self.window[0][0] >= 60:
+                self.window.popleft()
+
+            if self.in_flight >= int(self.concurrency):
+                return 0.05
+            if self.window and (len(self.window) >= self.rpm
+                                or sum(t for _, t in self.window) + tokens > self.tpm):
+                return max(60 - (now - self.window[0][0]), 0.05)
+
+            self.window.append((now, tokens))
+            self.in_flight += 1
+            return 0.0
+
+    def release(self, rate_limited: bool = False):
+        """Free the slot and adjust the concurrency limit."""
+        with self.lock:
+            self.in_flight -= 1
+            if rate_limited:
+                self.concurrency = max(1.0, self.concurrency * 0.5)
+            else:
+                self.concurrency = min(float(self.max_concurrency), self.concurrency + 1)
+
+
+# One limiter per process: the API budget belongs to the key, not to a browser session
+_limiter = RateLimiter()
+
+
+def _estimate_tokens(kwargs: Dict[str, Any]) -> int:
+    """Rough request size: ~4 characters per token for text, a flat estimate per image, plus max_tokens."""
+    chars = 0
+    images = 0
+    contents = [kwargs.get('system') or ''] + [message['content'] for message in kwargs.get('messages', [])]
+    for content in contents:
+        if isinstance(content, str):
+            chars += len(content)
+            continue
+        for block in content:
+            if block.get('type') == 'text':
+                chars += len(block['text'])
+            else:
+                images += 1
+    return chars // 4 + images * IMAGE_TOKEN_ESTIMATE + kwargs.get('max_tokens', 0)
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """Honour a retry-after header when present, else jittered exponential backoff."""
+    response = getattr(error, 'response', None)
+    retry_after = response.headers.get('retry-after') if response is not None else None
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        return (2 ** attempt) + random.uniform(0, 1)
+
+
+def _is_transient(error: Exception) -> bool:
+    """Server-side failures worth retrying: connection errors, timeouts, 5xx and 529 overloaded."""
+    if isinstance(error, anthropic.APIConnectionError):  # includes APITimeoutError
+        return True
+    return isinstance(error, anthropic.APIStatusError) and error.status_code >= 500
+
+
+def call_messages(client: Anthropic, **kwargs):
+    """
+    client.messages.create(**kwargs) behind the shared rate limiter
+    (client.beta.messages.create when betas are requested).
+    Rate-limit rejections and transient server errors are retried up to MAX_RETRIES
+    times; the SDK's own retries are disabled so every 429 feeds the limiter.
+    """
+    tokens = _estimate_tokens(kwargs)
+    client = client.with_options(max_retries=0)
+    messages = client.beta.messages if 'betas' in kwargs else client.messages
+    for attempt in range(MAX_RETRIES + 1):
+        wait = _limiter.try_acquire(tokens)
+        while wait:
+            time.sleep(wait)
+            wait = _limiter.try_acquire(tokens)
+        try:
+            response = messages.create(**kwargs)
+        except anthropic.RateLimitError as e:
+            _limiter.release(rate_limited=True)
+            if attempt == MAX_RETRIES:
+                raise
+            time.sleep(_retry_delay(e, attempt))
+            continue
+        except (anthropic.APIConnectionError, anthropic.APIStatusError) as e:
+            _limiter.release()
+            if attempt == MAX_RETRIES or not _is_transient(e):
+                raise
+            time.sleep(_retry_delay(e, attempt))
+            continue
+        except Exception:
+            _limiter.release()
+            raise
+        _limiter.release()
+        return response
+
+
+def stream_messages(client: Anthropic, **kwargs) -> Iterator[str]:
+    """
+    client.messages.stream(**kwargs) behind the shared rate limiter, yielding
+    text deltas as they arrive (suitable for st.write_stream).
+    Rate-limit rejections and transient errors are retried like call_messages,
+    but only before the first delta has been yielded.
+    """
+    tokens = _estimate_tokens(kwargs)
+    client = client.with_options(max_retries=0)
+    for attempt in range(MAX_RETRIES + 1):
+        wait = _limiter.try_acquire(tokens)
+        while wait:
+            time.sleep(wait)
+            wait = _limiter.try_acquire(tokens)
+        started = False
+        rate_limited = False
+        try:
+            with client.messages.stream(**kwargs) as stream:
+                for text in stream.text_stream:
+                    started = True
+                    yield text
+            return
+        except anthropic.RateLimitError as e:
+            rate_limited = True
+            if started or attempt == MAX_RETRIES:
+                raise
+            delay = _retry_delay(e, attempt)
+        except (anthropic.APIConnectionError, anthropic.APIStatusError) as e:
+            if started or attempt == MAX_RETRIES or not _is_transient(e):
+                raise
+            delay = _retry_delay(e, attempt)
+        finally:
+            # Also runs if the consumer abandons the generator mid-stream
+            _limiter.release(rate_limited=rate_limited)
+        time.sleep(delay)
+
+
+async def acall_messages(client: anthropic.AsyncAnthropic, **kwargs):
+    """Async counterpart of call_messages for AsyncAnthropic clients; shares the same limiter."""
+    tokens = _estimate_tokens(kwargs)
+    client = client.with_options(max_retries=0)
+    messages = client.beta.messages if 'betas' in kwargs else client.messages
+    for attempt in range(MAX_RETRIES + 1):
+        wait = _limiter.try_acquire(tokens)
+        while wait:
+            await asyncio.sleep(wait)
+            wait = _limiter.try_acquire(tokens)
+        try:
+            response = await messages.create(**kwargs)
+        except anthropic.RateLimitError as e:
+            _limiter.release(rate_limited=True)
+            if attempt == MAX_RETRIES:
+                raise
+            await asyncio.sleep(_retry_delay(e, attempt))
+            continue
+        except (anthropic.APIConnectionError, anthropic.APIStatusError) as e:
+            _limiter.release()
+            if attempt == MAX_RETRIES or not _is_transient(e):
+                raise
+            await asyncio.sleep(_retry_delay(e, attempt))
+            continue
+        except Exception:
+            _limiter.release()
+            raise
+        _limiter.release()
+        return response
@@ -5,26 +5,44 @@ Interactive chat interface for asking questions about General Ledger data.
 
 import streamlit as st
 import pandas as pd
+import numpy as np
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
 from anthropic import Anthropic
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
 import processor
+import claude_client
 
 
-def format_gl_context(gl_df: pd.DataFrame, max_rows: int = 500) -> str:
+# Bounded: besides the full GL, every chat question formats its own retrieved subset
+@st.cache_data(show_spinner=False, max_entries=64, ttl=3600)
+def format_gl_context(gl_df: pd.DataFrame, max_rows: int = 500, total_rows: Optional[int] = None) -> str:
     """
     Format GL data as context for Claude.
     Limits to recent transactions if dataset is large.
+    Cached on the DataFrame contents, so the text for a GL (or a repeated
+    question's subset) is built once rather than on every chat turn.
+
+    total_rows is the size of the full GL when gl_df is a retrieved subset of it.
     """
     if gl_df.empty:
         return "No GL data available."
 
-    # Sort by date and take most recent transactions if too large
-    gl_sorted = gl_df.sort_values('Date', ascending=False)
-    if len(gl_sorted) > max_rows:
-        gl_sorted = gl_sorted.head(max_rows)
+    # Take most recent transactions if too large - partial selection, no full sort
+    if len(gl_df) > max_rows:
+        gl_sorted = gl_df.nlargest(max_rows, 'Date')
         note = f"\n(Showing most recent {max_rows} of {len(gl_df)} total transactions)\n"
     else:
+        gl_sorted = gl_df.sort_values('Date', ascending=False)
         note = f"\n(All {len(gl_df)} transactions included)\n"
+    if total_rows is not None and total_rows > len(gl_df):
+        note = (f"\n(Showing {len(gl_sorted)} transactions relevant to the question, "
+                f"out of {total_rows} total)\n")
 
     # Format as structured text
     lines = ["GENERAL LEDGER DATA", "=" * 80, note]
@@ -35,58 +53,351 @@ def format_gl_context(gl_df: pd.DataFrame, max_rows: int = 500) -> str:
     lines.append(f"Total Credits: {gl_sorted['Credit'].sum():,.2f}")
     lines.append(f"Unique Accounts: {gl_sorted['Account'].nunique()}")
     lines.append("")
-    lines.append("TRANSACTIONS:")
-    lines.append("-" * 80)
-
-    # Add transaction details
-    for idx, row in gl_sorted.iterrows():
-        date_str = row['Date'].strftime('%Y-%m-%d') if pd.notna(row['Date']) else 'Unknown'
-        account = row['Account']
-        desc = row['Description']
-        debit = row['Debit']
-        credit = row['Credit']
-        amount = debit if debit > 0 else -credit
-
-        line = f"{date_str} | {account} | {desc} | Amount: {amount:,.2f}"
-        lines.append(line)
+    lines.append("TRANSACTIONS (CSV; Amount is positive for debits, negative for credits):")
+
+    # Add transaction details as compact CSV - far fewer tokens than labelled prose
+    debit = gl_sorted['Debit'].to_numpy()
+    credit = gl_sorted['Credit'].to_numpy()
+    transactions = pd.DataFrame({
+        'Date': (gl_sorted['Date_Str'] if 'Date_Str' in gl_sorted.columns
+                 else gl_sorted['Date'].dt.strftime('%Y-%m-%d').fillna('Unknown')),
+        'Account': gl_sorted['Account'],
+        'Description': gl_sorted['Description'],
+        'Amount': np.where(debit > 0, debit, -credit)
+    })
+    lines.append(transactions.to_csv(index=False, float_format='%.2f').rstrip('\n'))
 
     return "\n".join(lines)
 
 
-def call_claude_chat(messages: List[Dict], gl_context: str, api_key: str) -> str:
+# Questions about the ledger as a whole need every transaction, not a matching subset.
+# Matched on word boundaries, so "account" does not hit "count" nor "everyone" "every".
+AGGREGATE_PATTERN = re.compile(
+    r'\b(?:totals?|summar\w*|overall|overview|trends?|patterns?|anomal\w*|unusual|largest|biggest|top'
+    r'|average|how many|counts?|compare|breakdown|all transactions|every)\b'
+)
+
+QUERY_STOPWORDS = {
+    'the', 'and', 'for', 'with', 'what', 'which', 'who', 'when', 'where', 'how', 'did', 'does',
+    'was', 'were', 'are', 'our', 'we', 'you', 'any', 'there', 'this', 'that', 'from', 'into',
+    'show', 'list', 'tell', 'give', 'find', 'about', 'spend', 'spent', 'paid', 'pay', 'have',
+    'has', 'many', 'much', 'transactions', 'transaction', 'account', 'accounts', 'between',
+    'over', 'above', 'more', 'than', 'greater', 'less', 'below', 'under', 'during', 'month',
+    'months', 'last', 'past', 'previous', 'recent', 'recently', 'latest', 'days', 'week', 'weeks',
+    'quarter', 'year', 'years',
+}
+
+MONTHS = {name: i for i, names in enumerate(
+    [('jan', 'january'), ('feb', 'february'), ('mar', 'march'), ('apr', 'april'),
+     ('may',), ('jun', 'june'), ('jul', 'july'), ('aug', 'august'),
+     ('sep', 'sept', 'september'), ('oct', 'october'), ('nov', 'november'), ('dec', 'december')],
+    start=1) for name in names}
+
+# "last month", "past 3 weeks", "this quarter": a window ending at the latest GL date,
+# since the ledger's own dates (not today's) are what the question refers to
+RELATIVE_PERIOD_PATTERN = re.compile(
+    r'\b(?:last|past|previous|recent|latest|this)\s+(?:(\d+)\s+)?(day|week|month|quarter|year)s?\b'
+)
+PERIOD_DAYS = {'day': 1, 'week': 7, 'month': 31, 'quarter': 92, 'year': 366}
+
+AMOUNT_THRESHOLD_PATTERN = re.compile(
+    r'(over|above|more than|greater than|exceeding|>|under|below|less than|<)\s*\$?\s*([\d,]+(?:\.\d+)?)\s*(k\b)?'
+)
+
+
+@st.cache_data(show_spinner=False)
+def _gl_search_text(gl_df: pd.DataFrame) -> pd.Series:
+    """Lower-cased Account + Description per row, built once per GL upload."""
+    return (gl_df['Account'].astype(str) + ' ' + gl_df['Description'].fillna('').astype(str)).str.lower()
+
+
+def retrieve_relevant_rows(gl_df: pd.DataFrame, query: str, k: int = 50) -> pd.DataFrame:
+    """
+    Select the GL rows relevant to a chat question.
+    Month/year, relative-period and amount-threshold mentions prefilter the rows, then the remaining
+    words are matched against Account + Description and scored BM25-style (rarer
+    terms weigh more); the top k matches are returned.
+
+    Falls back to the whole GL for aggregate questions and for questions with
+    nothing to match on, so those still see every transaction.
+    """
+    q = query.lower()
+    if gl_df.empty or AGGREGATE_PATTERN.search(q):
+        return gl_df
+
+    words = re.findall(r'[a-z0-9]+', q)
+    mask = np.ones(len(gl_df), dtype=bool)
+    filtered = False
+
+    # Date prefilter on any years / month names mentioned
+    years = [int(w) for w in words if len(w) == 4 and w.isdigit() and 1990 <= int(w) <= 2100]
+    months = [MONTHS[w] for w in words if w in MONTHS]
+    if years:
+        mask &= gl_df['Date'].dt.year.isin(years).to_numpy()
+        filtered = True
+    if months:
+        mask &= gl_df['Date'].dt.month.isin(months).to_numpy()
+        filtered = True
+
+    # Relative period prefilter, counted back from the most recent transaction
+    for count, period in RELATIVE_PERIOD_PATTERN.findall(q):
+        start = gl_df['Date'].max() - pd.Timedelta(days=PERIOD_DAYS[period] * int(count or 1))
+        mask &= (gl_df['Date'] > start).to_numpy()
+        filtered = True
+
+    # Amount threshold prefilter ("over 10,000", "below $500", "above 5k")
+    for op, number, thousands in AMOUNT_THRESHOLD_PATTERN.findall(q):
+        threshold = float(number.replace(',', '')) * (1000 if thousands else 1)
+        amount = np.maximum(gl_df['Debit'].to_numpy(), gl_df['Credit'].to_numpy())
+        if op in ('under', 'below', 'less than', '<'):
+            mask &= amount < threshold
+        else:
+            mask &= amount > threshold
+        filtered = True
+
+    terms = {w for w in words
+             if len(w) >= 3 and w not in QUERY_STOPWORDS and w not in MONTHS
+             and not w.replace(',', '').isdigit()}
+    if not terms:
+        return gl_df[mask] if filtered else gl_df
+
+    text = _gl_search_text(gl_df)[mask]
+    n = len(text)
+    scores = np.zeros(n)
+    for term in terms:
+        # Terms match from a word start ("rent" finds "rental", not "current")
+        hits = np.asarray(text.str.contains(rf'\b{re.escape(term)}', regex=True), dtype=bool)
+        df_term = hits.sum()
+        if df_term:
+            scores += hits * np.log((n - df_term + 0.5) / (df_term + 0.5) + 1)
+
+    if not scores.any():
+        # Nothing matched the words - let Claude see the (date/amount filtered) ledger
+        return gl_df[mask] if filtered else gl_df
+
+    subset = gl_df[mask]
+    top = np.argsort(-scores, kind='stable')[:k]
+    return subset.iloc[top[scores[top] > 0]]
+
+
+# Stable system prompt for GL chat; sent ahead of the GL data so both form one cached prefix
+GL_CHAT_INSTRUCTIONS = """You are a financial analysis assistant answering questions about the General Ledger data that follows.
+- Answer only from that data; if something is not in it, say so.
+- Be concise but thorough: summaries, patterns, anomalies, specific transactions.
+- Format numbers with commas."""
+
+
+@st.cache_data(show_spinner=False)
+def get_gl_summary(gl_df: pd.DataFrame) -> Dict:
+    """
+    Compute the GL summary metrics shown above the chat.
+    Cached on the DataFrame contents so reruns don't rescan every column.
+    """
+    return {
+        'transactions': len(gl_df),
+        'total_debit': gl_df['Debit'].sum(),
+        'total_credit': gl_df['Credit'].sum(),
+        'unique_accounts': (gl_df['Account'].cat.categories.size
+                            if isinstance(gl_df['Account'].dtype, pd.CategoricalDtype)
+                            else gl_df['Account'].nunique()),
+        'date_min': gl_df['Date'].min(),
+        'date_max': gl_df['Date'].max()
+    }
+
+
+def call_claude_chat(messages: List[Dict], gl_context: str, api_key: str) -> Iterator[str]:
     """
     Call Claude API with chat messages and GL context.
+    Streams the response, yielding text chunks as they arrive.
     """
     try:
-        client = Anthropic(api_key=api_key)
+        client = claude_client.get_client(api_key)
+
+        # Static instructions first, GL data second. One cache breakpoint after the GL
+        # block caches the whole system prompt across turns; the instructions alone are
+        # far below the 1024-token minimum and would never cache as their own prefix
+        yield from claude_client.stream_messages(
+            client,
+            model="claude-sonnet-4-5-20250929",
+            max_tokens=4096,
+            system=[
+                {
+                    "type": "text",
+                    "text": GL_CHAT_INSTRUCTIONS
+                },
+                {
+                    "type": "text",
+                    "text": gl_context,
+                    "cache_control": {"type": "ephemeral"}
+                }
+            ],
+            messages=messages
+        )
+
+    except Exception as e:
+        yield f"Error calling Claude API: {str(e)}"
 
-        # Build system message with GL context
-        system_message = f"""You are a helpful financial analysis assistant. You have access to General Ledger transaction data.
 
-{gl_context}
+# Number of most recent chat messages sent verbatim; older turns are folded into a summary
+CHAT_HISTORY_KEEP = 6
 
-Your role:
-- Answer questions about the GL data above
-- Provide summaries, analysis, and insights
-- Help identify patterns, anomalies, or specific transactions
-- Be concise but thorough
-- Use actual data from the GL to support your answers
-- Format numbers with commas for readability
 
-If asked about something not in the data, clearly state that."""
+def summarize_chat(messages: List[Dict], previous_summary: str, client: Anthropic) -> Optional[str]:
+    """
+    Condense older chat turns (plus any earlier summary) into a short summary.
+    Returns None if the API call fails, so the caller leaves the summary point where it was.
+    Touches no Streamlit state, so it can run on a worker thread.
+    """
+    transcript = "\n\n".join(
+        f"{'User' if msg['role'] == 'user' else 'Assistant'}: {msg['content']}"
+        for msg in messages
+    )
+    if previous_summary:
+        transcript = f"Earlier summary: {previous_summary}\n\n{transcript}"
 
-        # Call Claude API
-        response = client.messages.create(
+    try:
+        # Through the shared limiter, so the overlapping answer and summary calls share one budget
+        response = claude_client.call_messages(
+            client,
             model="claude-sonnet-4-5-20250929",
-            max_tokens=4096,
-            system=system_message,
-            messages=messages
+            max_tokens=300,
+            messages=[{
+                "role": "user",
+                "content": f"Summarize the following dialogue about GL data in at most 200 tokens. "
+                           f"Keep any figures, accounts and conclusions.\n\n{transcript}"
+            }]
         )
+        return response.content[0].text or None
+    except Exception:
+        return None
 
-        return response.content[0].text
 
-    except Exception as e:
-        return f"Error calling Claude API: {str(e)}"
+def build_api_messages(history: List[Dict], keep: int = CHAT_HISTORY_KEEP) -> Tuple[List[Dict], Optional[int]]:
+    """
+    Build the messages list for Claude from the chat history.
+    Everything before the summarized point is replaced by the running summary.
+
+    Also returns the index the summary should be advanced to when more than
+    2 * keep messages sit past the summarized point (None otherwise). The
+    caller summarizes up to that index alongside the answer call, so prompt
+    size stays bounded however long the conversation gets.
+    """
+    summarized_upto = st.session_state.get('gl_chat_summarized_upto', 0)
+    summary = st.session_state.get('gl_chat_summary', '')
+
+    summarize_to = None
+    if len(history) - summarized_upto > 2 * keep:
+        summarize_to = len(history) - keep
+        # The summary is sent as a user message, so the verbatim window must open on an assistant turn
+        if history[summarize_to]['role'] == 'user':
+            summarize_to -= 1
+
+    api_messages = []
+    if summary and summarized_upto > 0:
+        api_messages.append({
+            "role": "user",
+            "content": f"[Prior conversation summary]: {summary}"
+        })
+    for msg in history[summarized_upto:]:
+        message = {"role": msg["role"], "content": msg["content"]}
+        # Collapse repeats: a message identical to the previous one, or a question and
+        # answer identical to the previous exchange, only adds payload
+        if api_messages and message == api_messages[-1]:
+            continue
+        if (len(api_messages) >= 3 and message["role"] == "assistant"
+                and api_messages[-3:-1] == [api_messages[-1], message]):
+            api_messages.pop()
+            continue
+        api_messages.append(message)
+    return api_messages, summarize_to
+
+
+# Chat messages kept in session state; older ones are spilled to a per-session file on disk
+CHAT_HISTORY_MAX = 50
+
+
+def _chat_overflow_path() -> str:
+    """Path of the on-disk overflow file for this browser session's chat history."""
+    if 'gl_chat_id' not in st.session_state:
+        st.session_state.gl_chat_id = uuid.uuid4().hex
+    return os.path.join(tempfile.gettempdir(), f"gl_chat_{st.session_state.gl_chat_id}.jsonl")
+
+
+def append_chat_message(role: str, content: str):
+    """
+    Append a message to the chat history, keeping at most CHAT_HISTORY_MAX in memory.
+    Only messages already covered by the running summary are evicted, so history
+    past a failed summary stays in memory until a later summary succeeds. The
+    in-memory tail always starts on a user turn. Evicted messages are appended to
+    the overflow file and the summary index is shifted to match.
+    """
+    history = st.session_state.gl_chat_history
+    history.append({"role": role, "content": content})
+
+    summarized_upto = st.session_state.get('gl_chat_summarized_upto', 0)
+    evict = min(len(history) - CHAT_HISTORY_MAX, summarized_upto)
+    while evict > 0 and history[evict]['role'] != 'user':
+        evict -= 1
+    if evict > 0:
+        with open(_chat_overflow_path(), 'a', encoding='utf-8') as f:
+            for msg in history[:evict]:
+                f.write(json.dumps(msg) + "\n")
+        del history[:evict]
+        # Stays > 0: the summarized point is an assistant turn, after the user turn the tail opens on
+        st.session_state.gl_chat_summarized_upto = summarized_upto - evict
+
+
+def cleanup_chat_overflow(hours: int = 24):
+    """
+    Delete chat overflow files not written to for the given number of hours.
+    Abandoned browser sessions never press Clear Chat, so their transcripts are swept here.
+    """
+    cutoff = time.time() - hours * 3600
+    with os.scandir(tempfile.gettempdir()) as entries:
+        expired = [
+            entry.path for entry in entries
+            if entry.name.startswith('gl_chat_') and entry.name.endswith('.jsonl')
+            and entry.stat().st_mtime < cutoff
+        ]
+    for path in expired:
+        os.remove(path)
+
+
+def iter_chat_history(overflow_path: str, history: List[Dict]) -> Iterator[Dict]:
+    """
+    Yield the full chat history: spilled messages from disk, then the in-memory tail.
+    Takes its inputs explicitly so it can run outside the script thread.
+    """
+    if os.path.exists(overflow_path):
+        with open(overflow_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+    yield from history
+
+
+# Suggested question buttons: (label, question sent to Claude), two per column
+SUGGESTED_QUESTIONS = [
+    [("📊 Summarize all transactions by account", "Summarize all transactions by account"),
+     ("🔍 What are the largest transactions?", "What are the largest transactions by amount?")],
+    [("📅 Show transactions from last month", "Show me transactions from the last month"),
+     ("⚠️ Are there any unusual patterns?", "Are there any unusual patterns or anomalies in the transactions?")],
+]
+
+
+@st.fragment
+def show_suggested_questions():
+    """
+    Render the suggested-question buttons as a fragment, isolated from the
+    chat's own reruns. A click queues the question and escalates to a full
+    app rerun, where show_gl_chat_interface picks it up.
+    """
+    st.markdown("**💡 Try asking:**")
+    for col, questions in zip(st.columns(2), SUGGESTED_QUESTIONS):
+        with col:
+            for label, question in questions:
+                if st.button(label):
+                    st.session_state.gl_chat_input = question
+                    st.rerun()
 
 
 def show_gl_chat_interface(gl_df: pd.DataFrame, api_key: str):
@@ -107,34 +418,24 @@ def show_gl_chat_interface(gl_df: pd.DataFrame, api_key: str):
 
     # Show GL data summary
     with st.expander("📊 GL Data Summary", expanded=False):
+        summary = get_gl_summary(gl_df)
         col1, col2, col3, col4 = st.columns(4)
         with col1:
-            st.metric("Total Transactions", f"{len(gl_df):,}")
+            st.metric("Total Transactions", f"{summary['transactions']:,}")
         with col2:
-            st.metric("Total Debits", f"${gl_df['Debit'].sum():,.0f}")
+            st.metric("Total Debits", f"${summary['total_debit']:,.0f}")
         with col3:
-            st.metric("Total Credits", f"${gl_df['Credit'].sum():,.0f}")
+            st.metric("Total Credits", f"${summary['total_credit']:,.0f}")
         with col4:
-            st.metric("Unique Accounts", f"{gl_df['Account'].nunique()}")
+            st.metric("Unique Accounts", f"{summary['unique_accounts']}")
 
         st.markdown("**Date Range:**")
-        st.write(f"{gl_df['Date'].min().strftime('%Y-%m-%d')} to {gl_df['Date'].max().strftime('%Y-%m-%d')}")
+        st.write(f"{summary['date_min'].strftime('%Y-%m-%d')} to {summary['date_max'].strftime('%Y-%m-%d')}")
 
     st.markdown("---")
 
     # Suggested questions
-    st.markdown("**💡 Try asking:**")
-    col1, col2 = st.columns(2)
-    with col1:
-        if st.button("📊 Summarize all transactions by account"):
-            st.session_state.gl_chat_input = "Summarize all transactions by account"
-        if st.button("🔍 What are the largest transactions?"):
-            st.session_state.gl_chat_input = "What are the largest transactions by amount?"
-    with col2:
-        if st.button("📅 Show transactions from last month"):
-            st.session_state.gl_chat_input = "Show me transactions from the last month"
-        if st.button("⚠️ Are there any unusual patterns?"):
-            st.session_state.gl_chat_input = "Are there any unusual patterns or anomalies in the transactions?"
+    show_suggested_questions()
 
     st.markdown("---")
 
@@ -155,42 +456,49 @@ def show_gl_chat_interface(gl_df: pd.DataFrame, api_key: str):
 
     if user_input:
         # Add user message to history
-        st.session_state.gl_chat_history.append({
-            "role": "user",
-            "content": user_input
-        })
+        append_chat_message("user", user_input)
 
         # Display user message
         with chat_container:
             with st.chat_message("user"):
                 st.markdown(user_input)
 
-        # Prepare GL context
-        gl_context = format_gl_context(gl_df)
-
-        # Build messages for Claude (without system message in messages list)
-        api_messages = []
-        for msg in st.session_state.gl_chat_history:
-            api_messages.append({
-                "role": msg["role"],
-                "content": msg["content"]
-            })
-
-        # Get Claude's response
-        with chat_container:
-            with st.chat_message("assistant"):
-                with st.spinner("Analyzing GL data..."):
-                    response = call_claude_chat(api_messages, gl_context, api_key)
-                    st.markdown(response)
+        # Prepare GL context from the transactions relevant to this question
+        gl_subset = retrieve_relevant_rows(gl_df, user_input)
+        gl_context = format_gl_context(gl_subset, total_rows=len(gl_df))
+
+        # Build messages for Claude (without system message in messages list);
+        # older turns are folded into a running summary
+        history = st.session_state.gl_chat_history
+        api_messages, summarize_to = build_api_messages(history)
+
+        # Get Claude's response. When the summary is due it is refreshed on a worker
+        # thread while the answer streams, so the two calls overlap instead of queueing.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            summary_future = None
+            if summarize_to is not None:
+                summary_future = executor.submit(
+                    summarize_chat,
+                    history[st.session_state.get('gl_chat_summarized_upto', 0):summarize_to],
+                    st.session_state.get('gl_chat_summary', ''),
+                    claude_client.get_client(api_key)
+                )
+
+            with chat_container:
+                with st.chat_message("assistant"):
+                    # Render tokens as they arrive; write_stream returns the full text
+                    response = st.write_stream(call_claude_chat(api_messages, gl_context, api_key))
+
+        # Only advance past messages that actually made it into a summary; otherwise the
+        # history would be cut at an assistant turn with nothing in front of it
+        new_summary = summary_future.result() if summary_future is not None else None
+        if new_summary:
+            st.session_state.gl_chat_summary = new_summary
+            st.session_state.gl_chat_summarized_upto = summarize_to
 
         # Add assistant response to history
-        st.session_state.gl_chat_history.append({
-            "role": "assistant",
-            "content": response
-        })
-
-        # Rerun to update chat display
-        st.rerun()
+        append_chat_message("assistant", response)
+        # No rerun needed - both messages were already rendered into chat_container
 
     # Clear chat button
     st.markdown("---")
@@ -198,17 +506,23 @@ def show_gl_chat_interface(gl_df: pd.DataFrame, api_key: str):
     with col1:
         if st.button("🗑️ Clear Chat", width='stretch'):
             st.session_state.gl_chat_history = []
+            if os.path.exists(_chat_overflow_path()):
+                os.remove(_chat_overflow_path())
+            st.session_state.gl_chat_summary = ''
+            st.session_state.gl_chat_summarized_upto = 0
             st.rerun()
     with col2:
-        if st.button("📥 Download Chat", width='stretch'):
-            chat_text = "\n\n".join([
+        # Transcript is only built when the download is actually requested
+        overflow_path = _chat_overflow_path()
+        history = list(st.session_state.gl_chat_history)
+        st.download_button(
+            label="📥 Download Chat",
+            data=lambda: "\n\n".join(
                 f"{'User' if msg['role'] == 'user' else 'Claude'}: {msg['content']}"
-                for msg in st.session_state.gl_chat_history
-            ])
-            st.download_button(
-                label="Download as Text",
-                data=chat_text,
-                file_name="gl_chat_history.txt",
-                mime="text/plain",
-                width='stretch'
-            )
+                for msg in iter_chat_history(overflow_path, history)
+            ),
+            file_name="gl_chat_history.txt",
+            mime="text/plain",
+            width='stretch',
+            on_click="ignore"
+        )
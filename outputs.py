@@ -4,10 +4,42 @@ Creates formatted Excel files and reports from Claude's analysis.
 """
 
 import pandas as pd
+import numpy as np
+import csv
 import io
 import re
-from typing import Dict, List, Tuple
-from datetime import datetime
+import time
+import warnings
+from html import escape
+from typing import Dict, List, Tuple, Union
+import processor
+
+# Precompiled patterns for parsing Claude's responses
+SEPARATOR_LINE_PATTERN = re.compile(r'^[\s\-|:]+$')
+TABLE_HEADER_PATTERN = re.compile(r'^(?=.*\|).*(?:account|balance|status|commentary)', re.IGNORECASE)
+PASS_PATTERN = re.compile(r'\bPASS\b', re.IGNORECASE)
+MISMATCH_PATTERN = re.compile(r'\bMISMATCH\b', re.IGNORECASE)
+UNMAPPED_PATTERN = re.compile(r'\bUnmapped\b', re.IGNORECASE)
+EXECUTIVE_SUMMARY_PATTERN = re.compile(r'OUTPUT C.*?EXECUTIVE SUMMARY.*?$(.*)', re.IGNORECASE | re.DOTALL)
+
+
+def _standard_column_name(col_lower: str) -> str:
+    """Map a lower-cased table header from Claude to the expected column name ('' if none)."""
+    if 'account' in col_lower:
+        return 'Account'
+    elif 'balance' in col_lower and 'type' in col_lower:
+        return 'Balance_Type'
+    elif 'amount' in col_lower:
+        return 'Amount'
+    elif 'category' in col_lower and 'sub' not in col_lower:
+        return 'Category'
+    elif 'subcategory' in col_lower or 'sub-category' in col_lower or 'sub category' in col_lower:
+        return 'Subcategory'
+    elif 'comment' in col_lower:
+        return 'Commentary'
+    elif 'status' in col_lower:
+        return 'Status'
+    return ''
 
 
 def parse_claude_table_response(response_text: str) -> pd.DataFrame:
@@ -20,7 +52,7 @@ def parse_claude_table_response(response_text: str) -> pd.DataFrame:
     # Find table start (look for header with |)
     table_start = None
     for i, line in enumerate(lines):
-        if '|' in line and any(keyword in line.lower() for keyword in ['account', 'balance', 'status', 'commentary']):
+        if TABLE_HEADER_PATTERN.search(line):
             table_start = i
             break
 
@@ -28,18 +60,13 @@ def parse_claude_table_response(response_text: str) -> pd.DataFrame:
         # No table found, return empty DataFrame
         return pd.DataFrame()
 
-    # Extract table lines (skip separator lines with only -, |, and spaces)
-    table_lines = []
-    for line in lines[table_start:]:
-        # Skip separator lines but keep data lines
-        if '|' in line and not re.match(r'^[\s\-|:]+$', line):
-            # Clean up the line - remove leading/trailing pipes
-            clean_line = line.strip()
-            if clean_line.startswith('|'):
-                clean_line = clean_line[1:]
-            if clean_line.endswith('|'):
-                clean_line = clean_line[:-1]
-            table_lines.append(clean_line)
+    # Extract table lines (skip separator lines with only -, |, and spaces),
+    # removing leading/trailing pipes
+    table_lines = [
+        line.strip().strip('|')
+        for line in lines[table_start:]
+        if '|' in line and not SEPARATOR_LINE_PATTERN.match(line)
+    ]
 
     if len(table_lines) < 2:  # Need at least header and one row
         return pd.DataFrame()
@@ -47,45 +74,39 @@ def parse_claude_table_response(response_text: str) -> pd.DataFrame:
     # Parse headers
     headers = [h.strip() for h in table_lines[0].split('|')]
     headers = [h for h in headers if h]  # Remove empty strings
+    if not headers:
+        return pd.DataFrame()
 
-    # Parse data rows
-    rows = []
-    for line in table_lines[1:]:
-        cells = [c.strip() for c in line.split('|')]
-        # Remove empty cells
-        cells = [c if c else '' for c in cells]
-
-        if len(cells) >= len(headers):
-            rows.append(cells[:len(headers)])
-        elif len(cells) > 0:
-            # Pad with empty strings if row is shorter
-            while len(cells) < len(headers):
-                cells.append('')
-            rows.append(cells)
-
-    if not rows:
+    # Parse data rows with the pandas tokenizer: short rows are padded,
+    # long rows are truncated to the header width
+    with warnings.catch_warnings():
+        # index_col=False warns about the truncation on_bad_lines performs on purpose
+        warnings.simplefilter('ignore', pd.errors.ParserWarning)
+        df = pd.read_csv(
+            io.StringIO('\n'.join(table_lines[1:])),
+            sep=r'\s*\|\s*',
+            engine='python',
+            header=None,
+            names=range(len(headers)),
+            # Never promote an extra first-row cell to the index; long rows go to on_bad_lines
+            index_col=False,
+            dtype=str,
+            quoting=csv.QUOTE_NONE,
+            keep_default_na=False,
+            on_bad_lines=lambda cells: cells[:len(headers)]
+        ).fillna('')
+
+    if df.empty:
         return pd.DataFrame()
 
-    df = pd.DataFrame(rows, columns=headers)
+    df.columns = headers
+    # The separator only absorbs whitespace around pipes, not at the row ends
+    df[headers[0]] = df[headers[0]].str.lstrip()
+    df[headers[-1]] = df[headers[-1]].str.rstrip()
 
     # Standardize column names to match expected format
-    column_mapping = {}
-    for col in df.columns:
-        col_lower = col.lower()
-        if 'account' in col_lower:
-            column_mapping[col] = 'Account'
-        elif 'balance' in col_lower and 'type' in col_lower:
-            column_mapping[col] = 'Balance_Type'
-        elif 'amount' in col_lower:
-            column_mapping[col] = 'Amount'
-        elif 'category' in col_lower and 'sub' not in col_lower:
-            column_mapping[col] = 'Category'
-        elif 'subcategory' in col_lower or 'sub-category' in col_lower or 'sub category' in col_lower:
-            column_mapping[col] = 'Subcategory'
-        elif 'comment' in col_lower:
-            column_mapping[col] = 'Commentary'
-        elif 'status' in col_lower:
-            column_mapping[col] = 'Status'
+    column_mapping = {col: _standard_column_name(col.lower()) for col in df.columns}
+    column_mapping = {col: name for col, name in column_mapping.items() if name}
 
     if column_mapping:
         df = df.rename(columns=column_mapping)
@@ -93,9 +114,76 @@ def parse_claude_table_response(response_text: str) -> pd.DataFrame:
     return df
 
 
-def create_classification_excel(analysis_text: str, tb_df: pd.DataFrame) -> io.BytesIO:
+def _text_column(df: pd.DataFrame, col: str) -> np.ndarray:
+    """Column as a string array, with '' for missing values or a missing column."""
+    if col not in df.columns:
+        return np.full(len(df), '', dtype=object)
+    return df[col].astype(object).fillna('').astype(str).to_numpy()
+
+
+def generate_commentary(df: pd.DataFrame, mismatch_note: str) -> np.ndarray:
+    """
+    Vectorized classification commentary for each row from Status, Category and Balance_Type.
+    mismatch_note is appended to the MISMATCH text.
+    """
+    status = _text_column(df, 'Status')
+    category = pd.Series(_text_column(df, 'Category'), index=df.index)
+    balance_text = (category + ' with ' + _text_column(df, 'Balance_Type') + ' balance - ').to_numpy()
+
+    return np.select(
+        [status == 'PASS', status == 'MISMATCH'],
+        [balance_text + 'Correct', balance_text + mismatch_note],
+        default=(category + ' - Review required').to_numpy()
+    )
+
+
+def _write_classification_sheet(output_df: pd.DataFrame, as_bytes: bool = False) -> Union[io.BytesIO, bytes]:
+    """
+    Write the Classification View sheet with xlsxwriter: bold headers, fitted
+    column widths, and PASS/MISMATCH fills on the Status column.
+    Returns the raw bytes when as_bytes is set, otherwise a rewound BytesIO.
+    """
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='xlsxwriter', engine_kwargs={
+        'options': {'strings_to_formulas': False, 'strings_to_urls': False}
+    }) as writer:
+        output_df.to_excel(writer, index=False, sheet_name='Classification View')
+
+        workbook = writer.book
+        worksheet = writer.sheets['Classification View']
+
+        # Format headers (bold) - pandas writes them with its own bold header style,
+        # so this only covers the rest of the row
+        worksheet.set_row(0, None, workbook.add_format({'bold': True}))
+
+        # Auto-adjust column widths - longest value per column in one vectorized pass
+        value_lengths = output_df.astype(str).apply(lambda col: col.str.len().max()).fillna(0).to_numpy()
+        header_lengths = [len(str(col)) for col in output_df.columns]
+        col_widths = np.minimum(np.maximum(value_lengths, header_lengths) + 2, 50)
+        for i, width in enumerate(col_widths):
+            worksheet.set_column(i, i, int(width))
+
+        # Color code Status column - one conditional format per status instead of a per-cell loop
+        if 'Status' in output_df.columns and len(output_df) > 0:
+            status_col = output_df.columns.get_loc('Status')
+            for value, color in (('MISMATCH', '#FFCCCC'), ('PASS', '#CCFFCC')):
+                worksheet.conditional_format(1, status_col, len(output_df), status_col, {
+                    'type': 'cell',
+                    'criteria': '==',
+                    'value': f'"{value}"',
+                    'format': workbook.add_format({'bg_color': color})
+                })
+
+    if as_bytes:
+        return output.getvalue()
+    output.seek(0)
+    return output
+
+
+def create_classification_excel(analysis_text: str, tb_df: pd.DataFrame, as_bytes: bool = False) -> Union[io.BytesIO, bytes]:
     """
     Create Output A - Classification View Excel file.
+    Returns bytes instead of a BytesIO when as_bytes is set.
 
     Columns:
     - Account No - Name
@@ -115,166 +203,52 @@ def create_classification_excel(analysis_text: str, tb_df: pd.DataFrame) -> io.B
 
         # Add missing columns
         if 'Balance_Type' not in result_df.columns:
-            result_df['Balance_Type'] = result_df.apply(
-                lambda row: 'Debit' if row['Debit'] > 0 else 'Credit' if row['Credit'] > 0 else 'Zero',
-                axis=1
-            )
+            result_df['Balance_Type'] = processor.get_balance_types(result_df)
 
         if 'Amount' not in result_df.columns:
-            result_df['Amount'] = result_df.apply(
-                lambda row: row['Debit'] if row['Debit'] > 0 else row['Credit'],
-                axis=1
-            )
+            result_df['Amount'] = processor.get_balance_amounts(result_df)
 
         # Infer Status based on category and balance type
         if 'Status' not in result_df.columns:
-            def infer_status(row):
-                category = str(row.get('Category', '')).lower()
-                balance_type = row.get('Balance_Type', '')
-
-                # Apply framework rules
-                if 'asset' in category and 'contra' not in category:
-                    return 'PASS' if balance_type == 'Debit' else 'MISMATCH'
-                elif 'liability' in category or 'equity' in category:
-                    return 'PASS' if balance_type == 'Credit' else 'MISMATCH'
-                elif 'clearing' in category:
-                    return 'PASS' if balance_type == 'Zero' else 'MISMATCH'
-                else:
-                    return 'PASS'  # Default for unmapped
-
-            result_df['Status'] = result_df.apply(infer_status, axis=1)
+            result_df['Status'] = processor.infer_status(
+                result_df, result_df['Balance_Type'].to_numpy()
+            )
 
         # Generate commentary based on status
-        if 'Commentary' not in result_df.columns or result_df['Commentary'].str.contains('pending', case=False, na=True).any():
-            def generate_commentary(row):
-                status = row.get('Status', '')
-                category = row.get('Category', '')
-                balance_type = row.get('Balance_Type', '')
-
-                if status == 'PASS':
-                    return f"{category} with {balance_type} balance - Correct"
-                elif status == 'MISMATCH':
-                    return f"{category} with {balance_type} balance - Incorrect (should be opposite)"
-                else:
-                    return f"{category} - Review required"
-
-            result_df['Commentary'] = result_df.apply(generate_commentary, axis=1)
-
-    # Ensure all required columns exist
-    required_cols = ['Account', 'Balance_Type', 'Amount', 'Category', 'Subcategory', 'Status', 'Commentary']
-    for col in required_cols:
-        if col not in result_df.columns:
-            result_df[col] = ''
+        # Early-exit scan: stops at the first pending (or missing) commentary
+        if 'Commentary' not in result_df.columns or any(
+            pd.isna(value) or 'pending' in str(value).lower() for value in result_df['Commentary'].to_numpy()
+        ):
+            result_df['Commentary'] = generate_commentary(result_df, 'Incorrect (should be opposite)')
 
-    # Reorder columns - Status comes BEFORE Commentary
-    output_df = result_df[required_cols]
+    # Ensure all required columns exist and reorder in one step - Status comes BEFORE Commentary
+    required_cols = ['Account', 'Balance_Type', 'Amount', 'Category', 'Subcategory', 'Status', 'Commentary']
+    output_df = result_df.reindex(columns=required_cols, fill_value='')
 
     # Create Excel file in memory
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        output_df.to_excel(writer, index=False, sheet_name='Classification View')
-
-        # Get the worksheet
-        worksheet = writer.sheets['Classification View']
-
-        # Format headers (bold)
-        for cell in worksheet[1]:
-            cell.font = cell.font.copy(bold=True)
-
-        # Auto-adjust column widths
-        for column in worksheet.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            worksheet.column_dimensions[column_letter].width = adjusted_width
-
-        # Color code status column
-        for row in range(2, len(output_df) + 2):
-            status_cell = worksheet.cell(row=row, column=7)  # Status is column 7
-            if status_cell.value == 'MISMATCH':
-                from openpyxl.styles import PatternFill
-                status_cell.fill = PatternFill(start_color='FFCCCC', end_color='FFCCCC', fill_type='solid')
-            elif status_cell.value == 'PASS':
-                from openpyxl.styles import PatternFill
-                status_cell.fill = PatternFill(start_color='CCFFCC', end_color='CCFFCC', fill_type='solid')
+    return _write_classification_sheet(output_df, as_bytes)
 
-    output.seek(0)
-    return output
 
-
-def create_classification_excel_from_df(df: pd.DataFrame) -> io.BytesIO:
+def create_classification_excel_from_df(df: pd.DataFrame, as_bytes: bool = False) -> Union[io.BytesIO, bytes]:
     """
     Create Excel output directly from the classification DataFrame.
     This ensures Excel matches exactly what's displayed on screen.
+    Returns bytes instead of a BytesIO when as_bytes is set.
     """
-    from openpyxl.styles import PatternFill, Font
-
     # Ensure required columns exist
     required_cols = ['Account', 'Balance_Type', 'Amount', 'Category', 'Subcategory', 'Status', 'Commentary']
 
     # Add missing columns if needed
     if 'Commentary' not in df.columns:
-        def generate_commentary(row):
-            status = row.get('Status', '')
-            category = row.get('Category', '')
-            balance_type = row.get('Balance_Type', '')
-
-            if status == 'PASS':
-                return f"{category} with {balance_type} balance - Correct"
-            elif status == 'MISMATCH':
-                return f"{category} with {balance_type} balance - Should be opposite"
-            else:
-                return f"{category} - Review required"
-
         df = df.copy()
-        df['Commentary'] = df.apply(generate_commentary, axis=1)
+        df['Commentary'] = generate_commentary(df, 'Should be opposite')
 
     # Select and order columns
     output_cols = [col for col in required_cols if col in df.columns]
-    output_df = df[output_cols].copy()
+    output_df = df[output_cols]
 
     # Create Excel file
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        output_df.to_excel(writer, index=False, sheet_name='Classification View')
-
-        worksheet = writer.sheets['Classification View']
-
-        # Format headers
-        for cell in worksheet[1]:
-            cell.font = Font(bold=True)
-
-        # Auto-adjust column widths
-        for column in worksheet.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            worksheet.column_dimensions[column_letter].width = adjusted_width
-
-        # Color code Status column
-        status_col_idx = output_cols.index('Status') + 1 if 'Status' in output_cols else None
-        if status_col_idx:
-            for row in range(2, len(output_df) + 2):
-                status_cell = worksheet.cell(row=row, column=status_col_idx)
-                if status_cell.value == 'MISMATCH':
-                    status_cell.fill = PatternFill(start_color='FFCCCC', end_color='FFCCCC', fill_type='solid')
-                elif status_cell.value == 'PASS':
-                    status_cell.fill = PatternFill(start_color='CCFFCC', end_color='CCFFCC', fill_type='solid')
-
-    output.seek(0)
-    return output
+    return _write_classification_sheet(output_df, as_bytes)
 
 
 def format_reconciliation_report(analysis_text: str) -> str:
@@ -289,7 +263,7 @@ def format_reconciliation_report(analysis_text: str) -> str:
     <div style="font-family: Arial, sans-serif; padding: 20px;">
         <h2>Output B: Account-Level Reconciliation</h2>
         <div style="white-space: pre-wrap; line-height: 1.6;">
-            {analysis_text}
+            {escape(analysis_text)}
         </div>
     </div>
     """
@@ -301,7 +275,7 @@ def format_executive_summary(analysis_text: str) -> str:
     Format Output C - Executive Summary as HTML.
     """
     # Extract executive summary section if present
-    summary_match = re.search(r'OUTPUT C.*?EXECUTIVE SUMMARY.*?$(.*)', analysis_text, re.IGNORECASE | re.DOTALL)
+    summary_match = EXECUTIVE_SUMMARY_PATTERN.search(analysis_text)
     if summary_match:
         summary_text = summary_match.group(1).strip()
     else:
@@ -311,102 +285,96 @@ def format_executive_summary(analysis_text: str) -> str:
     <div style="font-family: Arial, sans-serif; padding: 20px;">
         <h2>Output C: Executive Summary</h2>
         <div style="white-space: pre-wrap; line-height: 1.6;">
-            {summary_text}
+            {escape(summary_text)}
         </div>
     </div>
     """
     return html
 
 
-def create_combined_report(classification_text: str, reconciliation_text: str = None, summary_text: str = None) -> str:
-    """
-    Create a combined HTML report with all outputs.
-    """
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-    html_parts = [f"""
+# Combined report template pieces; the static head (with CSS) is never re-formatted
+REPORT_HEADER = """
     <html>
     <head>
         <title>Balance Sheet Buddy - Analysis Report</title>
         <style>
-            body {{
+            body {
                 font-family: Arial, sans-serif;
                 margin: 40px;
                 background-color: #f5f5f5;
-            }}
-            .header {{
+            }
+            .header {
                 background-color: #1f77b4;
                 color: white;
                 padding: 20px;
                 border-radius: 5px;
                 margin-bottom: 20px;
-            }}
-            .section {{
+            }
+            .section {
                 background-color: white;
                 padding: 20px;
                 margin-bottom: 20px;
                 border-radius: 5px;
                 box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-            }}
-            h2 {{
+            }
+            h2 {
                 color: #1f77b4;
                 border-bottom: 2px solid #1f77b4;
                 padding-bottom: 10px;
-            }}
-            .timestamp {{
+            }
+            .timestamp {
                 color: #666;
                 font-size: 0.9em;
-            }}
-            .status-pass {{
+            }
+            .status-pass {
                 color: green;
                 font-weight: bold;
-            }}
-            .status-mismatch {{
+            }
+            .status-mismatch {
                 color: red;
                 font-weight: bold;
-            }}
+            }
         </style>
     </head>
-    <body>
+    <body>"""
+
+REPORT_BANNER = """
         <div class="header">
             <h1>Balance Sheet Buddy - Analysis Report</h1>
             <p class="timestamp">Generated: {timestamp}</p>
         </div>
-    """]
-
-    # Add classification output
-    if classification_text:
-        html_parts.append(f"""
-        <div class="section">
-            <h2>Classification Analysis</h2>
-            <pre style="white-space: pre-wrap; line-height: 1.6;">{classification_text}</pre>
-        </div>
-        """)
-
-    # Add reconciliation output
-    if reconciliation_text:
-        html_parts.append(f"""
-        <div class="section">
-            <h2>Account-Level Reconciliation</h2>
-            <pre style="white-space: pre-wrap; line-height: 1.6;">{reconciliation_text}</pre>
-        </div>
-        """)
+    """
 
-    # Add executive summary
-    if summary_text:
-        html_parts.append(f"""
+REPORT_SECTION = """
         <div class="section">
-            <h2>Executive Summary</h2>
-            <pre style="white-space: pre-wrap; line-height: 1.6;">{summary_text}</pre>
+            <h2>{title}</h2>
+            <pre style="white-space: pre-wrap; line-height: 1.6;">{body}</pre>
         </div>
-        """)
+        """
 
-    html_parts.append("""
+REPORT_FOOTER = """
     </body>
     </html>
-    """)
+    """
+
 
-    return "".join(html_parts)
+def create_combined_report(classification_text: str, reconciliation_text: str = None, summary_text: str = None) -> str:
+    """
+    Create a combined HTML report with all outputs.
+    """
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+
+    sections = (
+        ('Classification Analysis', classification_text),
+        ('Account-Level Reconciliation', reconciliation_text),
+        ('Executive Summary', summary_text),
+    )
+    return "".join((
+        REPORT_HEADER,
+        REPORT_BANNER.format(timestamp=timestamp),
+        *(REPORT_SECTION.format(title=title, body=escape(body)) for title, body in sections if body),
+        REPORT_FOOTER
+    ))
 
 
 def extract_summary_stats(classification_text: str, df: pd.DataFrame = None) -> Dict:
@@ -429,32 +397,35 @@ def extract_summary_stats(classification_text: str, df: pd.DataFrame = None) ->
     if df is not None and not df.empty:
         stats['total_accounts'] = len(df)
 
+        # Normalize Status once; every count below reuses it
+        status_norm = None
         if 'Status' in df.columns:
-            # Filter out NaN values before counting
-            status_series = df['Status'].dropna().astype(str).str.strip()
-            stats['pass_count'] = len(status_series[status_series.str.upper() == 'PASS'])
-            stats['mismatch_count'] = len(status_series[status_series.str.upper() == 'MISMATCH'])
+            status_norm = df['Status'].fillna('').astype(str).str.strip().str.upper()
+            status_counts = status_norm.value_counts()
+            stats['pass_count'] = int(status_counts.get('PASS', 0))
+            stats['mismatch_count'] = int(status_counts.get('MISMATCH', 0))
 
             # Count accounts with other/empty status
-            all_status = df['Status'].fillna('').astype(str).str.strip().str.upper()
-            stats['other_status_count'] = len(df[~all_status.isin(['PASS', 'MISMATCH', ''])])
+            stats['other_status_count'] = int((~status_norm.isin(['PASS', 'MISMATCH', ''])).sum())
 
         if 'Category' in df.columns:
-            stats['unmapped_count'] = len(df[df['Category'] == 'Unmapped'])
+            # One hash aggregation yields the category counts and, when Status is
+            # present, the per-category status breakdown
+            if status_norm is not None:
+                status_by_category = pd.crosstab(df['Category'], status_norm)
+                category_counts = status_by_category.sum(axis=1)
+                for category, counts in status_by_category.iterrows():
+                    stats['by_status'][category] = {
+                        'total': int(counts.sum()),
+                        'pass': int(counts.get('PASS', 0)),
+                        'mismatch': int(counts.get('MISMATCH', 0))
+                    }
+            else:
+                category_counts = df.groupby('Category', observed=True).size()
+
             # Category breakdown
-            category_counts = df['Category'].value_counts().to_dict()
-            stats['by_category'] = category_counts
-
-        if 'Status' in df.columns and 'Category' in df.columns:
-            # Status by category
-            for category in df['Category'].unique():
-                cat_df = df[df['Category'] == category]
-                status_series = cat_df['Status'].dropna().astype(str)
-                stats['by_status'][category] = {
-                    'total': len(cat_df),
-                    'pass': len(status_series[status_series.str.upper() == 'PASS']),
-                    'mismatch': len(status_series[status_series.str.upper() == 'MISMATCH'])
-                }
+            stats['by_category'] = category_counts.sort_values(ascending=False).to_dict()
+            stats['unmapped_count'] = int(category_counts.get('Unmapped', 0))
 
         # Calculate totals
         if 'Debit' in df.columns:
@@ -464,9 +435,9 @@ def extract_summary_stats(classification_text: str, df: pd.DataFrame = None) ->
 
     else:
         # Fallback to text parsing
-        stats['pass_count'] = len(re.findall(r'\bPASS\b', classification_text, re.IGNORECASE))
-        stats['mismatch_count'] = len(re.findall(r'\bMISMATCH\b', classification_text, re.IGNORECASE))
-        stats['unmapped_count'] = len(re.findall(r'\bUnmapped\b', classification_text, re.IGNORECASE))
+        stats['pass_count'] = len(PASS_PATTERN.findall(classification_text))
+        stats['mismatch_count'] = len(MISMATCH_PATTERN.findall(classification_text))
+        stats['unmapped_count'] = len(UNMAPPED_PATTERN.findall(classification_text))
         stats['total_accounts'] = stats['pass_count'] + stats['mismatch_count']
 
     return stats
@@ -530,22 +501,22 @@ def create_summary_text(stats: Dict, df: pd.DataFrame = None) -> str:
 
     # List mismatched accounts if available
     if mismatched > 0 and df is not None and 'Status' in df.columns:
-        mismatch_df = df[df['Status'].str.upper() == 'MISMATCH']
-        if not mismatch_df.empty:
+        mask = df['Status'].astype(str).str.upper().to_numpy() == 'MISMATCH'
+        if mask.any():
             lines.extend([
                 "⚠️  ACCOUNTS REQUIRING REVIEW:",
                 "-" * 60
             ])
-            for idx, row in mismatch_df.iterrows():
-                account = row.get('Account', 'Unknown')
-                category = row.get('Category', 'N/A')
-                amount = row.get('Amount', 0)
-                # Convert amount to float if it's a string
-                try:
-                    amount_float = float(amount) if amount else 0.0
-                except (ValueError, TypeError):
-                    amount_float = 0.0
-                lines.append(f"   • {account} ({category}) - ${amount_float:,.2f}")
+            mismatch_df = df.loc[mask]
+            accounts = mismatch_df['Account'].to_numpy() if 'Account' in df.columns else ['Unknown'] * len(mismatch_df)
+            categories = mismatch_df['Category'].to_numpy() if 'Category' in df.columns else ['N/A'] * len(mismatch_df)
+            # Amounts may be strings from Claude's table; anything unparseable counts as 0
+            if 'Amount' in df.columns:
+                amounts = pd.to_numeric(mismatch_df['Amount'], errors='coerce').fillna(0.0).to_numpy()
+            else:
+                amounts = [0.0] * len(mismatch_df)
+            for account, category, amount in zip(accounts, categories, amounts):
+                lines.append(f"   • {account} ({category}) - ${amount:,.2f}")
             lines.append("")
 
     # Add category breakdown if available
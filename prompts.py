@@ -3,6 +3,8 @@ Framework prompts for Balance Sheet Buddy Agent.
 Based on the Master AI Reconciliation Framework.
 """
 
+from typing import Dict, List, Tuple
+
 FRAMEWORK_INSTRUCTIONS = """
 Balance Sheet Buddy Agent - Master AI Reconciliation Framework
 
@@ -44,26 +46,11 @@ SECTION 4 — ACCOUNT LEVEL RULES (BY SUBCATEGORY)
 """
 
 
-def generate_output_a_prompt(trial_balance_text: str) -> str:
-    """
-    Generate prompt for Output A - Classification View.
-
-    Output A should be a table with columns:
-    - Account No - Name
-    - Debit/Credit indicator
-    - Amount
-    - Category
-    - Subcategory
-    - Classification commentary
-    - Status (PASS or MISMATCH)
-    """
-    return f"""{FRAMEWORK_INSTRUCTIONS}
-
+# Task texts are module constants; prompts are assembled with str.join rather than
+# re-formatting the multi-KB templates on every call
+OUTPUT_A_TASK = """
 TASK: Generate Output A (Classification View) for all accounts.
 
-TRIAL BALANCE:
-{trial_balance_text}
-
 INSTRUCTIONS:
 1. For each account in the trial balance:
    - Identify whether it has a Debit or Credit balance
@@ -91,31 +78,13 @@ INSTRUCTIONS:
 Please provide the complete classification analysis now.
 """
 
-
-def generate_output_bc_prompt(trial_balance_text: str, gl_text: str) -> str:
-    """
-    Generate prompt for Output B & C - Account-Level Reconciliation and Executive Summary.
-
-    Output B: Account-level reconciliation with:
-    - Break-up of balance
-    - Top 5 balance components
-    - Age analysis (if applicable)
-    - Action recommendations
-
-    Output C: Executive summary with:
-    - Accounts fully reconciled
-    - Accounts requiring action
-    - Key risk items
-    """
-    return f"""{FRAMEWORK_INSTRUCTIONS}
-
+OUTPUT_BC_TASK_HEAD = """
 TASK: Generate Output B (Account-Level Reconciliation) and Output C (Executive Summary).
 
-TRIAL BALANCE:
-{trial_balance_text}
-
 GENERAL LEDGER TRANSACTIONS:
-{gl_text}
+"""
+
+OUTPUT_BC_TASK_TAIL = """
 
 INSTRUCTIONS FOR OUTPUT B (Account-Level Reconciliation):
 
@@ -163,17 +132,14 @@ Format Output C as a concise executive summary (1-2 pages max).
 Please provide both outputs now.
 """
 
-
-def generate_mismatch_only_prompt(trial_balance_text: str) -> str:
-    """
-    Generate prompt for Output A showing only MISMATCH accounts.
-    """
-    return f"""{FRAMEWORK_INSTRUCTIONS}
+MISMATCH_TASK_HEAD = """
 
 TASK: Generate Output A (Classification View) for MISMATCH accounts only.
 
 TRIAL BALANCE:
-{trial_balance_text}
+"""
+
+MISMATCH_TASK_TAIL = """
 
 INSTRUCTIONS:
 1. Analyze each account and identify those with MISMATCH status:
@@ -200,40 +166,124 @@ Please provide the mismatch analysis now.
 """
 
 
-def get_account_specific_rules(subcategory: str) -> str:
+def _trial_balance_block(trial_balance_text: str) -> str:
+    """Wrap trial balance text as a standalone prompt block."""
+    return "".join(("\nTRIAL BALANCE:\n", trial_balance_text, "\n"))
+
+
+def to_cached_content(parts: Tuple[str, ...]) -> List[Dict]:
     """
-    Get specific analysis rules for an account subcategory.
+    Convert prompt parts into Anthropic content blocks.
+    Only the block before the last is marked as an ephemeral cache breakpoint: it
+    caches the whole shared prefix, while a breakpoint on the framework alone
+    (~470 tokens, under the 1024-token minimum) would never cache.
+    """
+    blocks = [{"type": "text", "text": text} for text in parts]
+    if len(blocks) > 1:
+        blocks[-2]["cache_control"] = {"type": "ephemeral"}
+    return blocks
+
+
+def generate_output_a_prompt(trial_balance_text: str) -> str:
     """
-    rules = {
-        "Accounts Payable": """
+    Generate prompt for Output A - Classification View.
+
+    Output A should be a table with columns:
+    - Account No - Name
+    - Debit/Credit indicator
+    - Amount
+    - Category
+    - Subcategory
+    - Classification commentary
+    - Status (PASS or MISMATCH)
+    """
+    return "".join(generate_output_a_prompt_parts(trial_balance_text))
+
+
+def generate_output_a_prompt_parts(trial_balance_text: str) -> Tuple[str, str, str]:
+    """
+    Generate the Output A prompt split into (framework, trial balance, task).
+
+    The framework and trial balance blocks come first so they form a stable
+    prefix that can be marked for prompt caching; only the task tail varies.
+    """
+    return (
+        FRAMEWORK_INSTRUCTIONS,
+        _trial_balance_block(trial_balance_text),
+        OUTPUT_A_TASK
+    )
+
+
+def generate_output_bc_prompt(trial_balance_text: str, gl_text: str) -> str:
+    """
+    Generate prompt for Output B & C - Account-Level Reconciliation and Executive Summary.
+
+    Output B: Account-level reconciliation with:
+    - Break-up of balance
+    - Top 5 balance components
+    - Age analysis (if applicable)
+    - Action recommendations
+
+    Output C: Executive summary with:
+    - Accounts fully reconciled
+    - Accounts requiring action
+    - Key risk items
+    """
+    return "".join(generate_output_bc_prompt_parts(trial_balance_text, gl_text))
+
+
+def generate_output_bc_prompt_parts(trial_balance_text: str, gl_text: str) -> Tuple[str, str, str]:
+    """
+    Generate the Output B & C prompt split into (framework, trial balance, task).
+
+    Shares its first two blocks with the Output A prompt so both calls hit
+    the same cached prefix.
+    """
+    return (
+        FRAMEWORK_INSTRUCTIONS,
+        _trial_balance_block(trial_balance_text),
+        "".join((OUTPUT_BC_TASK_HEAD, gl_text, OUTPUT_BC_TASK_TAIL))
+    )
+
+
+def generate_mismatch_only_prompt(trial_balance_text: str) -> str:
+    """
+    Generate prompt for Output A showing only MISMATCH accounts.
+    """
+    return "".join((FRAMEWORK_INSTRUCTIONS, MISMATCH_TASK_HEAD, trial_balance_text, MISMATCH_TASK_TAIL))
+
+
+# Subcategory-specific analysis rules, built once at import
+ACCOUNT_SPECIFIC_RULES = {
+    "Accounts Payable": """
         - Flag any balances older than January 1, 2024 for write-off/write-back consideration
         - Identify offsetting balances that could be squared off
         - Summarize by vendor if possible
         - Check for credit balances (potential overpayments)
         """,
-        "Accounts Receivable": """
+    "Accounts Receivable": """
         - Provide aging analysis (< 30, 30-60, 60-90, > 90 days)
         - Request collection status for overdue amounts
         - Flag balances > 1 year old
         - Check for debit balances (potential incorrect postings)
         """,
-        "Accrued Expenses": """
+    "Accrued Expenses": """
         - Summarize by accrual date and description
         - Verify if accruals have been reversed in subsequent period
         - Check if amounts are reasonable based on historical patterns
         """,
-        "Banks": """
+    "Banks": """
         - Note that bank accounts should be reconciled periodically
         - Check for unusual or old outstanding items
         - Verify if book balance matches expected bank balance
         """,
-        "Clearing": """
+    "Clearing": """
         - Balance should be nil/zero
         - Locate and explain any open balances
         - Identify offsetting entries that haven't cleared
         - Recommend resolution for hanging items
         """,
-        "Deferred Revenue": """
+    "Deferred Revenue": """
         - Provide deferred revenue waterfall showing:
           * Opening balance
           * Additions during period
@@ -241,23 +291,30 @@ def get_account_specific_rules(subcategory: str) -> str:
           * Closing balance
         - Summarize by contract/customer if available
         """,
-        "PPE": """
+    "PPE": """
         - Verify depreciation setup is appropriate
         - Check if depreciation rates are reasonable
         - Note any fully depreciated assets still in use
         - Flag any disposals or impairments
         """,
-        "Intercompany": """
+    "Intercompany": """
         - Summarize balances by counterparty entity
         - Recommend intercompany reconciliation
         - Flag any old or unusual intercompany balances
         - Check for offsetting balances between entities
         """
-    }
+}
 
-    return rules.get(subcategory, """
+DEFAULT_ACCOUNT_RULES = """
     - Summarize transactions by posting period
     - Provide description/memo summary
     - Identify any unusual or large transactions
     - Note any patterns or concerns
-    """)
+    """
+
+
+def get_account_specific_rules(subcategory: str) -> str:
+    """
+    Get specific analysis rules for an account subcategory.
+    """
+    return ACCOUNT_SPECIFIC_RULES.get(subcategory, DEFAULT_ACCOUNT_RULES)
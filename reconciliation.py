@@ -4,39 +4,523 @@ Handles interactive account-by-account reconciliation with Claude.
 """
 
 import streamlit as st
+import streamlit.components.v1 as components
 import pandas as pd
+import numpy as np
 import json
 import os
+import sqlite3
+import asyncio
+import hashlib
+import time
+import zlib
+from contextlib import closing
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
 import io
+import processor
 import session_manager
+import claude_client
+
+
+# Per-account reconciliation state lives in a small SQLite file per TB session,
+# so marking one account reconciled is a single-row upsert rather than a full rewrite
+STATE_COLUMNS = ('reconciled', 'timestamp', 'memo', 'gl_rows', 'type')
+UPSERT_STATE_SQL = (
+    "INSERT OR REPLACE INTO recon (account, reconciled, timestamp, memo, gl_rows, type) VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+
+def _connect_state_db(session_id: str) -> sqlite3.Connection:
+    """Open (creating if needed) the session's state database."""
+    conn = sqlite3.connect(f".reconciliation_{session_id}.db")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS recon ("
+        "account TEXT PRIMARY KEY, reconciled INT, timestamp TEXT, memo TEXT, gl_rows INT, type TEXT)"
+    )
+    return conn
 
 
 def load_reconciliation_state(session_id: str) -> Dict:
     """
-    Load reconciliation state from file.
+    Load reconciliation state from the session's database.
     Returns dict with account reconciliation data.
+    A legacy .reconciliation_state_{id}.json file is imported on first load.
     """
-    state_file = f".reconciliation_state_{session_id}.json"
-    if os.path.exists(state_file):
-        with open(state_file, 'r') as f:
-            return json.load(f)
-    return {}
+    db_file = f".reconciliation_{session_id}.db"
+    legacy_file = f".reconciliation_state_{session_id}.json"
+    if not os.path.exists(db_file):
+        if not os.path.exists(legacy_file):
+            return {}
+        with open(legacy_file, 'r') as f:
+            state = json.load(f)
+        with closing(_connect_state_db(session_id)) as conn, conn:
+            conn.executemany(UPSERT_STATE_SQL, [_state_row(account, entry) for account, entry in state.items()])
+        return state
+
+    with closing(_connect_state_db(session_id)) as conn:
+        rows = conn.execute("SELECT account, reconciled, timestamp, memo, gl_rows, type FROM recon").fetchall()
+
+    state = {}
+    for account, reconciled, *rest in rows:
+        entry = {'reconciled': bool(reconciled)}
+        entry.update((col, value) for col, value in zip(STATE_COLUMNS[1:], rest) if value is not None)
+        if isinstance(entry.get('memo'), bytes):
+            entry['memo'] = zlib.decompress(entry['memo']).decode('utf-8')
+        state[account] = entry
+    return state
+
+
+def _state_row(account: str, entry: Dict) -> tuple:
+    """Flatten a state entry into a recon table row; the memo is stored zlib-compressed."""
+    values = [entry.get(col) for col in STATE_COLUMNS[1:]]
+    memo = entry.get('memo')
+    if memo is not None:
+        values[STATE_COLUMNS.index('memo') - 1] = zlib.compress(memo.encode('utf-8'))
+    return (account, int(bool(entry.get('reconciled', False))), *values)
+
+
+def save_account_state(session_id: str, account: str, entry: Dict):
+    """Insert or replace one account's reconciliation entry."""
+    with closing(_connect_state_db(session_id)) as conn, conn:
+        conn.execute(UPSERT_STATE_SQL, _state_row(account, entry))
 
 
-def save_reconciliation_state(session_id: str, state: Dict):
-    """Save reconciliation state to file."""
-    state_file = f".reconciliation_state_{session_id}.json"
-    with open(state_file, 'w') as f:
-        json.dump(state, f, indent=2)
+def get_session_id(tb_merged: pd.DataFrame) -> str:
+    """
+    Generate a unique session ID based on TB data.
+    Computed once per tb_merged object and kept in session_state, like get_account_row.
+    """
+    cached = st.session_state.get('recon_session_id')
+    if cached is not None and cached[0] is tb_merged:
+        return cached[1]
+
+    # BLAKE2b over the sorted account list: stable across restarts (unlike hash()),
+    # so the same TB finds its state file again
+    digest = hashlib.blake2b(digest_size=8)
+    for account in sorted(tb_merged['Account'].astype(str).tolist()):
+        digest.update(account.encode())
+        digest.update(b'\0')
+    st.session_state.recon_session_id = (tb_merged, digest.hexdigest())
+    return st.session_state.recon_session_id[1]
+
+
+@st.cache_data(show_spinner=False)
+def parse_gl_dump_cached(gl_bytes: bytes, gl_name: str) -> pd.DataFrame:
+    """
+    Parse an uploaded GL dump, memoized on the raw file bytes.
+    Reruns (button clicks, chat turns) reuse the parsed frame instead of re-reading the file.
+    """
+    gl_buffer = io.BytesIO(gl_bytes)
+    gl_buffer.name = gl_name  # parse_gl_dump picks Excel vs CSV from the name
+    return processor.parse_gl_dump(gl_buffer)
 
 
-def get_session_id(tb_merged: pd.DataFrame) -> str:
-    """Generate a unique session ID based on TB data."""
-    # Use hash of account list as session ID
-    accounts = sorted(tb_merged['Account'].astype(str).tolist())
-    return str(hash(''.join(accounts)))[:10]
+def get_account_row(tb_merged: pd.DataFrame, account: str) -> pd.Series:
+    """
+    Look up an account's TB row by its string name.
+    The Account-indexed frame is built once per tb_merged object and kept in
+    session_state, so each lookup is a hash probe instead of a cast + scan.
+    """
+    cached = st.session_state.get('tb_by_account')
+    if cached is None or cached[0] is not tb_merged:
+        tb_by_account = tb_merged.set_index(tb_merged['Account'].astype(str))
+        tb_by_account = tb_by_account[~tb_by_account.index.duplicated()]  # first row wins, as with .iloc[0]
+        cached = (tb_merged, tb_by_account)
+        st.session_state.tb_by_account = cached
+    return cached[1].loc[account]
+
+
+# Analysis sections requested for every account, single or packed
+RECON_ANALYSIS_SECTIONS = """## SECTION 1: RECONCILIATION MEMO
+- Summary of account activity
+- Key observations and findings
+- Any discrepancies or issues identified
+- Balance validation (does it match expected behavior?)
+
+## SECTION 2: RECONCILIATION SCHEDULE
+Detailed breakdown in table format:
+- By vendor/counterparty (if applicable)
+- By date/aging buckets (if applicable)
+- By transaction type (if applicable)
+Show amounts clearly with totals
+
+## SECTION 3: OUTPUT B - ACCOUNT-LEVEL ANALYSIS
+- Top 5 largest components of this balance
+- Aging analysis (if applicable - group by date ranges)
+- Key risk items or unusual transactions
+- Validation of balance type (should it be debit/credit?)
+- Any red flags or items needing investigation
+
+## SECTION 4: OUTPUT C - EXECUTIVE SUMMARY
+- High-level summary (2-3 sentences for executives)
+- Key findings and concerns
+- Priority recommendations
+- Overall status: **Clean** / **Needs Attention** / **Critical**
+
+## SECTION 5: RECOMMENDATIONS
+- Specific actions needed
+- Priority level for each action
+- Who should handle (if relevant)
+
+Format professionally with clear headers and tables where appropriate.
+"""
+
+
+def _account_details(account: str, account_row: pd.Series, gl_text: str) -> str:
+    """Account header and GL transactions block shared by the reconciliation prompts."""
+    return f"""Account: {account}
+Category: {account_row.get('Category', 'N/A')}
+Subcategory: {account_row.get('Subcategory', 'N/A')}
+Balance: Debit ${account_row['Debit']:,.2f} / Credit ${account_row['Credit']:,.2f}
+
+GL Transactions:
+{gl_text}"""
+
+
+def build_reconciliation_prompt(account: str, account_row: pd.Series, gl_text: str) -> str:
+    """Build the "Analyze with Claude" prompt for one account and its GL text."""
+    return "".join((
+        "Perform a comprehensive reconciliation analysis for this account:\n\n",
+        _account_details(account, account_row, gl_text),
+        "\n\nProvide a comprehensive analysis with the following sections:\n\n",
+        RECON_ANALYSIS_SECTIONS
+    ))
+
+
+def build_packed_reconciliation_prompt(items: List[Tuple[str, pd.Series, str]]) -> str:
+    """
+    Build one prompt reconciling several (account, account_row, gl_text) items.
+    The reply is a JSON object so it can be split back into per-account results.
+    """
+    accounts = "\n\n".join(
+        f"=== ACCOUNT {n} ===\n{_account_details(account, account_row, gl_text)}"
+        for n, (account, account_row, gl_text) in enumerate(items, 1)
+    )
+    return "".join((
+        f"Perform a comprehensive reconciliation analysis for each of the following {len(items)} accounts:\n\n",
+        accounts,
+        "\n\nFor EACH account, provide a comprehensive analysis with the following sections:\n\n",
+        RECON_ANALYSIS_SECTIONS,
+        '\nReturn ONLY a JSON object of the form {"results": [{"account": "<account exactly as given>", '
+        '"analysis": "<the full markdown analysis for that account>"}]}, with one entry per account.\n'
+    ))
+
+
+RECON_MAX_TOKENS = 4096
+
+# Bump when build_reconciliation_prompt or the bank prompt changes, so cached answers are not reused
+RECON_PROMPT_VERSION = 1
+
+
+# Claude answers are kept in a shared SQLite file for RESPONSE_CACHE_TTL seconds, and only
+# the newest RESPONSE_CACHE_MAX_ENTRIES rows survive each insert, so the cache never grows unbounded
+RESPONSE_CACHE_DB = ".claude_response_cache.db"
+RESPONSE_CACHE_TTL = 24 * 3600
+RESPONSE_CACHE_MAX_ENTRIES = 128
+
+
+def _connect_response_cache() -> sqlite3.Connection:
+    """Open (creating if needed) the shared response cache database."""
+    conn = sqlite3.connect(RESPONSE_CACHE_DB)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, created_at REAL, response BLOB)")
+    return conn
+
+
+def _response_cache_key(*parts) -> str:
+    """sha256 of the JSON-encoded call inputs."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _get_cached_response(key: str) -> Optional[str]:
+    """Return the stored answer for key, or None if missing or older than RESPONSE_CACHE_TTL."""
+    with closing(_connect_response_cache()) as conn:
+        row = conn.execute(
+            "SELECT response FROM responses WHERE key = ? AND created_at > ?",
+            (key, time.time() - RESPONSE_CACHE_TTL)
+        ).fetchone()
+    return zlib.decompress(row[0]).decode('utf-8') if row else None
+
+
+def _store_response(key: str, response: str):
+    """Store an answer, then drop expired rows and all but the newest RESPONSE_CACHE_MAX_ENTRIES."""
+    now = time.time()
+    with closing(_connect_response_cache()) as conn, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, created_at, response) VALUES (?, ?, ?)",
+            (key, now, zlib.compress(response.encode('utf-8')))
+        )
+        conn.execute("DELETE FROM responses WHERE created_at <= ?", (now - RESPONSE_CACHE_TTL,))
+        conn.execute(
+            "DELETE FROM responses WHERE key NOT IN "
+            "(SELECT key FROM responses ORDER BY created_at DESC LIMIT ?)",
+            (RESPONSE_CACHE_MAX_ENTRIES,)
+        )
+
+
+def claude_response_cached(content, max_tokens: int, prompt_version: int, _api_key: str) -> str:
+    """
+    Single-turn Claude call memoized in the response cache by its content
+    (account, GL text, prompt text) and prompt_version. Re-analyzing an
+    unchanged account within a day returns the stored answer instead of
+    paying for another model call. Failed calls raise and are not cached.
+    """
+    key = _response_cache_key('analysis', content, max_tokens, prompt_version)
+    cached = _get_cached_response(key)
+    if cached is not None:
+        return cached
+
+    response = claude_client.call_messages(
+        claude_client.get_client(_api_key),
+        model="claude-sonnet-4-5-20250929",
+        max_tokens=max_tokens,
+        messages=[{"role": "user", "content": content}]
+    )
+    text = response.content[0].text
+    _store_response(key, text)
+    return text
+
+
+# Accounts whose GL text is under PACK_GL_TOKENS (roughly 500 GL lines) are reconciled
+# PACK_SIZE at a time in one request, cutting the request count when RPM is the limit
+PACK_SIZE = 5
+PACK_GL_TOKENS = 6000
+
+
+def _parse_packed_results(text: str) -> Dict[str, str]:
+    """Split a packed JSON reply into {account: analysis}; unparseable replies give {}."""
+    try:
+        data = json.loads(text[text.find('{'):text.rfind('}') + 1])
+        items = data.get('results', [])
+        return {
+            str(item['account']): item['analysis']
+            for item in items if isinstance(item, dict) and item.get('account') and item.get('analysis')
+        }
+    except (ValueError, AttributeError, TypeError):
+        return {}
+
+
+# Anthropic Files API (beta): bank statements are uploaded and referenced by file_id
+FILES_API_BETA = "files-api-2025-04-14"
+
+
+def upload_statement_file(file_name: str, media_type: str, statement: bytes, api_key: str) -> str:
+    """Upload a bank statement to the Files API and return its id."""
+    client = claude_client.get_client(api_key)
+    return client.beta.files.upload(file=(file_name, statement, media_type)).id
+
+
+def compare_bank_statement_cached(statement_digest: str, file_name: str, media_type: str, prompt: str,
+                                  prompt_version: int, _statement: bytes, _api_key: str) -> str:
+    """
+    Compare a bank statement with the GL balance, memoized in the response cache
+    by the file's digest and the prompt. The statement is sent as a file_id reference, so a
+    rate-limit retry never re-sends the image bytes. The uploaded file is deleted
+    once the comparison is done: statements are sensitive, and nothing else
+    tracks the id.
+    """
+    key = _response_cache_key('bank', statement_digest, file_name, media_type, prompt, prompt_version)
+    cached = _get_cached_response(key)
+    if cached is not None:
+        return cached
+
+    client = claude_client.get_client(_api_key)
+    file_id = upload_statement_file(file_name, media_type, _statement, _api_key)
+    block_type = "document" if media_type == "application/pdf" else "image"
+    try:
+        response = claude_client.call_messages(
+            client,
+            model="claude-sonnet-4-5-20250929",
+            max_tokens=1024,
+            betas=[FILES_API_BETA],
+            messages=[{
+                "role": "user",
+                "content": [
+                    {"type": block_type, "source": {"type": "file", "file_id": file_id}},
+                    {"type": "text", "text": prompt}
+                ]
+            }]
+        )
+    finally:
+        try:
+            client.beta.files.delete(file_id)
+        except Exception:
+            pass  # Deleting is best effort - never mask the comparison result or its error
+    text = response.content[0].text
+    _store_response(key, text)
+    return text
+
+
+async def _analyze_accounts(api_key: str, account_inputs: Dict[str, Tuple[pd.Series, str]]) -> Dict[str, Optional[str]]:
+    """
+    Reconcile {account: (account_row, gl_text)} concurrently with AsyncAnthropic.
+    Small accounts are packed PACK_SIZE per request; any account missing from a
+    packed reply is retried on its own. Concurrency and the RPM/TPM budget are
+    enforced by claude_client's shared limiter.
+    Returns {account: response text}; failed calls map to None.
+    """
+    client = claude_client.new_async_client(api_key)
+
+    async def analyze(account: str):
+        account_row, gl_text = account_inputs[account]
+        try:
+            response = await claude_client.acall_messages(
+                client,
+                model="claude-sonnet-4-5-20250929",
+                max_tokens=RECON_MAX_TOKENS,
+                messages=[{"role": "user", "content": build_reconciliation_prompt(account, account_row, gl_text)}]
+            )
+            return [(account, response.content[0].text)]
+        except Exception:
+            return [(account, None)]
+
+    async def analyze_pack(accounts: List[str]):
+        items = [(account, *account_inputs[account]) for account in accounts]
+        try:
+            response = await claude_client.acall_messages(
+                client,
+                model="claude-sonnet-4-5-20250929",
+                max_tokens=RECON_MAX_TOKENS * len(accounts),
+                messages=[{"role": "user", "content": build_packed_reconciliation_prompt(items)}]
+            )
+            parsed = _parse_packed_results(response.content[0].text)
+        except Exception:
+            parsed = {}
+        missing = [account for account in accounts if account not in parsed]
+        retried = await asyncio.gather(*(analyze(account) for account in missing))
+        return [(account, parsed[account]) for account in accounts if account in parsed] + [r for rs in retried for r in rs]
+
+    small = [account for account, (_, gl_text) in account_inputs.items() if len(gl_text) // 4 < PACK_GL_TOKENS]
+    packs = [small[k:k + PACK_SIZE] for k in range(0, len(small), PACK_SIZE)]
+    small_set = set(small)
+    singles = [account for account in account_inputs if account not in small_set]
+    singles += [pack[0] for pack in packs if len(pack) == 1]
+    tasks = [analyze_pack(pack) for pack in packs if len(pack) > 1] + [analyze(account) for account in singles]
+
+    try:
+        results = await asyncio.gather(*tasks)
+    finally:
+        await client.close()
+    return dict(result for batch in results for result in batch)
+
+
+def show_reconcile_all(pending_df: pd.DataFrame, tb_merged: pd.DataFrame, api_key: str):
+    """
+    Bulk-analyze every pending account from a single all-accounts GL dump.
+    Results land in the same recon_result_{account} keys the per-account interface reads.
+    """
+    with st.expander(f"⚡ Reconcile All (Not Reconciled) - {len(pending_df)} accounts", expanded=False):
+        st.markdown("Upload the **GL Dump Details - All Accounts** export to analyze every pending account at once.")
+        gl_file = st.file_uploader(
+            "Upload GL transactions for all accounts",
+            type=['xlsx', 'xls', 'csv'],
+            key="gl_upload_all"
+        )
+
+        if gl_file and st.button("🤖 Analyze All with Claude", key="analyze_all"):
+            try:
+                gl_df = parse_gl_dump_cached(gl_file.getvalue(), gl_file.name)
+            except Exception as e:
+                st.error(f"Error parsing GL dump: {str(e)}")
+                return
+
+            account_inputs = {}
+            skipped = 0
+            for account in pending_df['Account'].astype(str):
+                if f'recon_result_{account}' in st.session_state:
+                    continue  # Already analyzed - only retry the rest
+                gl_text = processor.format_gl_for_claude(gl_df, account)
+                if gl_text.startswith("No GL transactions found"):
+                    skipped += 1
+                    continue
+                account_inputs[account] = (get_account_row(tb_merged, account), gl_text)
+
+            with st.spinner(f"Analyzing {len(account_inputs)} accounts..."):
+                results = asyncio.run(_analyze_accounts(api_key, account_inputs))
+
+            failed = 0
+            for account, result in results.items():
+                if result is None:
+                    failed += 1
+                else:
+                    st.session_state[f'recon_result_{account}'] = result
+            st.session_state.reconcile_all_summary = (len(results) - failed, skipped, failed)
+
+        if 'reconcile_all_summary' in st.session_state:
+            analyzed, skipped, failed = st.session_state.reconcile_all_summary
+            st.success(f"✓ Analyzed {analyzed} accounts" + (f" ({skipped} skipped - no GL transactions)" if skipped else ""))
+            if failed:
+                st.warning(f"⚠️ {failed} account(s) failed - run Analyze All again to retry them")
+            analyzed_accounts = [
+                acc for acc in pending_df['Account'].astype(str) if f'recon_result_{acc}' in st.session_state
+            ]
+            if analyzed_accounts:
+                preview_account = st.selectbox("View result for:", analyzed_accounts, key="reconcile_all_view")
+                st.markdown(st.session_state[f'recon_result_{preview_account}'])
+            st.caption("Open an account with **Reconcile** to mark it reconciled.")
+
+
+@st.cache_data(show_spinner=False)
+def subcategory_options(subcategories: pd.Series) -> List[str]:
+    """Options for the subcategory filter, memoized on the column contents."""
+    if isinstance(subcategories.dtype, pd.CategoricalDtype):
+        # astype('category') already sorted the categories; drop any no row uses
+        return ["All"] + subcategories.cat.remove_unused_categories().cat.categories.tolist()
+    return ["All"] + sorted(subcategories.unique().tolist())
+
+
+@st.fragment
+def show_account_list(filtered_df: pd.DataFrame):
+    """
+    Render the filtered account list as a fragment: selecting rows reruns only
+    this table, and the Reconcile button escalates to a full app rerun.
+    """
+    # Display account list as one table (a single Arrow payload instead of a widget row
+    # per account); selecting a row offers the Reconcile action for that account
+    # P&L and "PL - Ignore" accounts don't need reconciliation (Not_Required is set by the tab)
+    not_required = filtered_df['Not_Required'].to_numpy()
+    list_df = pd.DataFrame({
+        'Account': filtered_df['Account'].astype(str).to_numpy(),
+        'Debit': filtered_df['Debit'].where(filtered_df['Debit'] > 0).round(0).to_numpy(),
+        'Credit': filtered_df['Credit'].where(filtered_df['Credit'] > 0).round(0).to_numpy(),
+        'Subcategory': filtered_df['Subcategory'].to_numpy(),
+        'Status': np.select(
+            [not_required, filtered_df['Reconciled'].to_numpy()],
+            ['Not Required', '✓ Done'],
+            '⏳ Pending'
+        ),
+    })
+
+    selection = st.dataframe(
+        list_df,
+        width='stretch',
+        hide_index=True,
+        column_config={
+            'Debit': st.column_config.NumberColumn('Dr', format="localized"),
+            'Credit': st.column_config.NumberColumn('Cr', format="localized"),
+        },
+        on_select="rerun",
+        selection_mode="single-row",
+        key="recon_account_table"
+    )
+
+    selected_rows = selection.selection.rows
+    if selected_rows and selected_rows[0] < len(list_df):  # a stale selection can outlive a filter change
+        position = selected_rows[0]
+        account = list_df['Account'].iat[position]
+        if not_required[position]:
+            st.info(f"{account}: Not Required")
+        elif st.button(f"Reconcile {account}", key="recon_selected"):
+            st.session_state.selected_account = account
+            st.session_state.show_reconciliation_interface = True
+            st.session_state.scroll_pending = True
+            st.rerun()
+    else:
+        st.caption("Select an account row to reconcile it.")
 
 
 def show_reconciliation_tab(classification_df: pd.DataFrame, tb_merged: pd.DataFrame, api_key: str):
@@ -92,18 +576,26 @@ def show_reconciliation_tab(classification_df: pd.DataFrame, tb_merged: pd.DataF
     # Create reconciliation tracking DataFrame
     recon_df = classification_df.copy()
 
-    # Add Reconciled column
-    recon_df['Reconciled'] = recon_df['Account'].apply(
-        lambda acc: st.session_state.reconciliation_state.get(str(acc), {}).get('reconciled', False)
-    )
+    # Add Reconciled column - a set of reconciled accounts and one vectorized membership test
+    reconciled_accounts = {
+        acc for acc, entry in st.session_state.reconciliation_state.items() if entry.get('reconciled', False)
+    }
+    recon_df['Reconciled'] = recon_df['Account'].astype(str).isin(reconciled_accounts)
 
     # Summary statistics (exclude P&L and "PL - Ignore" accounts from reconciliation tracking)
-    # Use case-insensitive check for "ignore" in subcategory
-    accounts_needing_recon = recon_df[
-        ~recon_df['Subcategory'].astype(str).str.lower().str.contains('ignore|^pl$', na=False)
-    ]
-    total_accounts = len(accounts_needing_recon)
-    reconciled_count = accounts_needing_recon['Reconciled'].sum()
+    # Subcategory is categorical (merge_with_mapping), so the stripped, case-insensitive checks
+    # run over its distinct values and rows are selected by code; the exclusion mask is reused
+    # by the metrics, Reconcile All and the account list
+    subcategory_codes, subcategories = pd.factorize(recon_df['Subcategory'])
+    subcategories = pd.Index(subcategories).astype(str).str.strip()
+    subcategories_lower = subcategories.str.lower()
+    not_required_codes = np.flatnonzero(
+        (subcategories_lower == 'pl') | subcategories_lower.str.contains('ignore', regex=False)
+    )
+    recon_df['Not_Required'] = np.isin(subcategory_codes, not_required_codes)
+    needs_recon = ~recon_df['Not_Required']
+    total_accounts = int(needs_recon.sum())
+    reconciled_count = int((recon_df['Reconciled'] & needs_recon).sum())
     progress_pct = (reconciled_count / total_accounts * 100) if total_accounts > 0 else 0
 
     col1, col2, col3 = st.columns(3)
@@ -117,7 +609,7 @@ def show_reconciliation_tab(classification_df: pd.DataFrame, tb_merged: pd.DataF
     st.progress(progress_pct / 100)
 
     # Show info about excluded accounts
-    total_excluded = len(recon_df) - len(accounts_needing_recon)
+    total_excluded = len(recon_df) - total_accounts
     if total_excluded > 0:
         st.caption(f"ℹ️ {total_excluded} account(s) excluded (PL/PL-Ignore - no reconciliation needed)")
 
@@ -133,85 +625,62 @@ def show_reconciliation_tab(classification_df: pd.DataFrame, tb_merged: pd.DataF
     with col2:
         subcategory_filter = st.selectbox(
             "Filter by subcategory:",
-            ["All"] + sorted(recon_df['Subcategory'].unique().tolist())
+            subcategory_options(classification_df['Subcategory'])
         )
 
-    # Apply filters
-    filtered_df = recon_df.copy()
+    # Apply filters as one combined mask and a single row selection; with no
+    # filter chosen the frame is used as-is rather than copied through the mask
+    mask = np.ones(len(recon_df), dtype=bool)
     if show_filter == "Not Reconciled":
-        filtered_df = filtered_df[~filtered_df['Reconciled']]
+        mask &= ~recon_df['Reconciled'].to_numpy()
     elif show_filter == "Reconciled":
-        filtered_df = filtered_df[filtered_df['Reconciled']]
+        mask &= recon_df['Reconciled'].to_numpy()
     elif show_filter == "MISMATCH Only":
-        filtered_df = filtered_df[filtered_df['Status'].str.upper() == 'MISMATCH']
+        # Upper-case only the distinct status values, then select rows by their codes
+        codes, statuses = pd.factorize(recon_df['Status'])
+        mask &= np.isin(codes, np.flatnonzero(statuses.astype(str).str.upper() == 'MISMATCH'))
 
     if subcategory_filter != "All":
-        filtered_df = filtered_df[filtered_df['Subcategory'] == subcategory_filter]
+        mask &= (recon_df['Subcategory'] == subcategory_filter).to_numpy(dtype=bool, na_value=False)
+
+    if show_filter == "All Accounts" and subcategory_filter == "All":
+        filtered_df = recon_df
+    else:
+        filtered_df = recon_df[mask]
+
+    # Bulk analysis for pending accounts (bank accounts use the screenshot flow instead)
+    is_bank = np.isin(subcategory_codes, np.flatnonzero(subcategories == 'Banks'))
+    pending_df = recon_df[needs_recon & ~recon_df['Reconciled'] & ~is_bank]
+    if len(pending_df) > 0:
+        show_reconcile_all(pending_df, tb_merged, api_key)
 
     st.markdown(f"**Showing {len(filtered_df)} accounts**")
 
-    # Display account list with reconcile buttons
-    for idx, row in filtered_df.iterrows():
-        account = str(row['Account'])
-        with st.container():
-            cols = st.columns([3, 1, 1, 1, 1, 1])
-
-            with cols[0]:
-                st.write(f"**{account}**")
-            with cols[1]:
-                debit = row.get('Debit', 0)
-                if debit > 0:
-                    st.write(f"Dr: {debit:,.0f}")
-            with cols[2]:
-                credit = row.get('Credit', 0)
-                if credit > 0:
-                    st.write(f"Cr: {credit:,.0f}")
-            with cols[3]:
-                st.write(row.get('Subcategory', ''))
-            with cols[4]:
-                subcategory = str(row.get('Subcategory', '')).strip()
-                # P&L and "PL - Ignore" accounts don't need reconciliation
-                # Check with case-insensitive and stripped comparison
-                if subcategory == 'PL' or 'ignore' in subcategory.lower():
-                    st.info("Not Required")
-                elif row['Reconciled']:
-                    st.success("✓ Done")
-                else:
-                    st.warning("⏳ Pending")
-            with cols[5]:
-                subcategory = str(row.get('Subcategory', '')).strip()
-                # P&L and "PL - Ignore" accounts don't need reconciliation - no button
-                # Check with case-insensitive and stripped comparison
-                if subcategory == 'PL' or 'ignore' in subcategory.lower():
-                    st.write("—")
-                else:
-                    if st.button("Reconcile", key=f"recon_{idx}"):
-                        st.session_state.selected_account = account
-                        st.session_state.show_reconciliation_interface = True
-                        st.rerun()
+    show_account_list(filtered_df)
 
     # Show reconciliation interface if account selected
     if st.session_state.get('show_reconciliation_interface', False):
         # Add anchor for scrolling
         st.markdown('<div id="reconciliation-section"></div>', unsafe_allow_html=True)
 
-        # Use st.components to inject JavaScript for scrolling
-        import streamlit.components.v1 as components
-        components.html("""
-        <script>
-            // Scroll to reconciliation section
-            setTimeout(function() {
-                window.parent.document.getElementById('reconciliation-section').scrollIntoView({
-                    behavior: 'smooth',
-                    block: 'start'
-                });
-            }, 100);
-        </script>
-        """, height=0)
+        # Use st.components to inject JavaScript for scrolling - only on the run that
+        # opened the interface, not on every later rerun while it stays open
+        if st.session_state.pop('scroll_pending', False):
+            components.html("""
+            <script>
+                // Scroll to reconciliation section
+                setTimeout(function() {
+                    window.parent.document.getElementById('reconciliation-section').scrollIntoView({
+                        behavior: 'smooth',
+                        block: 'start'
+                    });
+                }, 100);
+            </script>
+            """, height=0)
 
         # Get selected account info to determine subcategory
         selected_account = st.session_state.selected_account
-        account_info = tb_merged[tb_merged['Account'].astype(str) == selected_account].iloc[0]
+        account_info = get_account_row(tb_merged, selected_account)
         subcategory = account_info.get('Subcategory', '')
 
         # Show appropriate interface based on subcategory
@@ -231,15 +700,17 @@ def show_reconciliation_tab(classification_df: pd.DataFrame, tb_merged: pd.DataF
             )
 
 
+@st.fragment
 def show_bank_reconciliation_interface(account: str, tb_merged: pd.DataFrame, session_id: str, api_key: str):
     """
     Show bank reconciliation interface - uses screenshot comparison instead of GL dump.
+    Runs as a fragment; only marking reconciled or going back reruns the whole tab.
     """
     st.markdown("---")
     st.markdown(f"## 🏦 Bank Reconciliation: {account}")
 
     # Get account info
-    account_row = tb_merged[tb_merged['Account'].astype(str) == account].iloc[0]
+    account_row = get_account_row(tb_merged, account)
 
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -271,15 +742,6 @@ def show_bank_reconciliation_interface(account: str, tb_merged: pd.DataFrame, se
 
         if st.button("🤖 Compare with Claude", key=f"compare_bank_{account}"):
             with st.spinner("Analyzing bank statement..."):
-                from anthropic import Anthropic
-                import base64
-
-                client = Anthropic(api_key=api_key)
-
-                # Read image and encode
-                bank_screenshot.seek(0)
-                image_data = base64.standard_b64encode(bank_screenshot.read()).decode("utf-8")
-
                 # Determine media type
                 media_type = "image/jpeg"
                 if bank_screenshot.type == "image/png":
@@ -308,33 +770,19 @@ RECONCILIATION NOTES:
 [Brief notes about the reconciliation]
 """
 
-                response = client.messages.create(
-                    model="claude-sonnet-4-5-20250929",
-                    max_tokens=1024,
-                    messages=[{
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "image",
-                                "source": {
-                                    "type": "base64",
-                                    "media_type": media_type,
-                                    "data": image_data,
-                                },
-                            },
-                            {
-                                "type": "text",
-                                "text": prompt
-                            }
-                        ]
-                    }]
+                statement = bank_screenshot.getvalue()
+                reconciliation_result = compare_bank_statement_cached(
+                    hashlib.blake2b(statement, digest_size=16).hexdigest(),
+                    bank_screenshot.name,
+                    media_type,
+                    prompt,
+                    prompt_version=RECON_PROMPT_VERSION,
+                    _statement=statement,
+                    _api_key=api_key
                 )
 
-                reconciliation_result = response.content[0].text
-
                 # Store in session state
                 st.session_state[f'bank_recon_result_{account}'] = reconciliation_result
-                st.rerun()
 
         # Show reconciliation results if available
         if f'bank_recon_result_{account}' in st.session_state:
@@ -367,8 +815,8 @@ RECONCILIATION NOTES:
                         'type': 'bank_screenshot'
                     }
 
-                    # Save to file
-                    save_reconciliation_state(session_id, st.session_state.reconciliation_state)
+                    # Persist just this account's entry
+                    save_account_state(session_id, account, st.session_state.reconciliation_state[account])
 
                     # Auto-save session
                     if st.session_state.current_session_id:
@@ -402,15 +850,17 @@ GL Balance: ${gl_balance:,.2f}
         st.rerun()
 
 
+@st.fragment
 def show_reconciliation_interface(account: str, tb_merged: pd.DataFrame, session_id: str, api_key: str):
     """
     Show the interactive reconciliation interface for a specific account.
+    Runs as a fragment; only marking reconciled or going back reruns the whole tab.
     """
     st.markdown("---")
     st.markdown(f"## 🔍 Reconciling: {account}")
 
     # Get account info
-    account_row = tb_merged[tb_merged['Account'].astype(str) == account].iloc[0]
+    account_row = get_account_row(tb_merged, account)
 
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -433,36 +883,36 @@ def show_reconciliation_interface(account: str, tb_merged: pd.DataFrame, session
 
         # Parse GL dump
         try:
-            import processor
-            gl_df = processor.parse_gl_dump(gl_file)
+            gl_df = parse_gl_dump_cached(gl_file.getvalue(), gl_file.name)
 
             # Overall summary
             st.write(f"**{len(gl_df)} transactions loaded**")
 
             # Year-by-year breakdown
             st.markdown("**📅 Breakdown by Year:**")
-            gl_df['Year'] = pd.to_datetime(gl_df['Date'], errors='coerce').dt.year
-            year_summary = gl_df.groupby('Year').agg({
-                'Debit': 'sum',
-                'Credit': 'sum',
-                'Date': 'count'
-            }).rename(columns={'Date': 'Transactions'})
+            # parse_gl_dump already returns Date as datetime64, so no second to_datetime pass
+            gl_df['Year'] = gl_df['Date'].dt.year
+            # groupby sorts the years and drops undated rows
+            year_summary = gl_df.groupby('Year').agg(
+                Transactions=('Date', 'count'),
+                Debit=('Debit', 'sum'),
+                Credit=('Credit', 'sum')
+            )
 
             # Display year summary in columns
-            years = sorted(year_summary.index.dropna().astype(int).tolist())
-            if years:
-                cols = st.columns(min(len(years), 4))  # Max 4 columns
-                for idx, year in enumerate(years):
+            if len(year_summary):
+                cols = st.columns(min(len(year_summary), 4))  # Max 4 columns
+                for idx, (year, transactions, debit, credit) in enumerate(year_summary.itertuples(name=None)):
                     with cols[idx % 4]:
                         st.metric(
-                            f"{year}",
-                            f"{int(year_summary.loc[year, 'Transactions'])} txns",
-                            f"Net: ${year_summary.loc[year, 'Debit'] - year_summary.loc[year, 'Credit']:,.0f}"
+                            f"{int(year)}",
+                            f"{int(transactions)} txns",
+                            f"Net: ${debit - credit:,.0f}"
                         )
 
             # Show transaction summary
             with st.expander("📊 View All Transactions", expanded=False):
-                st.dataframe(gl_df, width='stretch')
+                st.dataframe(gl_df, width='stretch', column_config={'Date_Str': None})
 
             # Interactive reconciliation with Claude
             st.markdown("### 2. Reconciliation Analysis")
@@ -472,69 +922,18 @@ def show_reconciliation_interface(account: str, tb_merged: pd.DataFrame, session
                     # Format data for Claude
                     gl_text = processor.format_gl_for_claude(gl_df, account)
 
-                    # Call Claude for reconciliation
-                    from anthropic import Anthropic
-                    import prompts
-
-                    client = Anthropic(api_key=api_key)
+                    # Call Claude for reconciliation (answers for unchanged GL data come from the cache)
+                    prompt = build_reconciliation_prompt(account, account_row, gl_text)
 
-                    prompt = f"""Perform a comprehensive reconciliation analysis for this account:
-
-Account: {account}
-Category: {account_row.get('Category', 'N/A')}
-Subcategory: {account_row.get('Subcategory', 'N/A')}
-Balance: Debit ${account_row['Debit']:,.2f} / Credit ${account_row['Credit']:,.2f}
-
-GL Transactions:
-{gl_text}
-
-Provide a comprehensive analysis with the following sections:
-
-## SECTION 1: RECONCILIATION MEMO
-- Summary of account activity
-- Key observations and findings
-- Any discrepancies or issues identified
-- Balance validation (does it match expected behavior?)
-
-## SECTION 2: RECONCILIATION SCHEDULE
-Detailed breakdown in table format:
-- By vendor/counterparty (if applicable)
-- By date/aging buckets (if applicable)
-- By transaction type (if applicable)
-Show amounts clearly with totals
-
-## SECTION 3: OUTPUT B - ACCOUNT-LEVEL ANALYSIS
-- Top 5 largest components of this balance
-- Aging analysis (if applicable - group by date ranges)
-- Key risk items or unusual transactions
-- Validation of balance type (should it be debit/credit?)
-- Any red flags or items needing investigation
-
-## SECTION 4: OUTPUT C - EXECUTIVE SUMMARY
-- High-level summary (2-3 sentences for executives)
-- Key findings and concerns
-- Priority recommendations
-- Overall status: **Clean** / **Needs Attention** / **Critical**
-
-## SECTION 5: RECOMMENDATIONS
-- Specific actions needed
-- Priority level for each action
-- Who should handle (if relevant)
-
-Format professionally with clear headers and tables where appropriate.
-"""
-
-                    response = client.messages.create(
-                        model="claude-sonnet-4-5-20250929",
-                        max_tokens=4096,
-                        messages=[{"role": "user", "content": prompt}]
+                    reconciliation_result = claude_response_cached(
+                        prompt,
+                        max_tokens=RECON_MAX_TOKENS,
+                        prompt_version=RECON_PROMPT_VERSION,
+                        _api_key=api_key
                     )
 
-                    reconciliation_result = response.content[0].text
-
                     # Store in session state
                     st.session_state[f'recon_result_{account}'] = reconciliation_result
-                    st.rerun()
 
             # Show reconciliation results if available
             if f'recon_result_{account}' in st.session_state:
@@ -558,8 +957,8 @@ Format professionally with clear headers and tables where appropriate.
                             'gl_rows': len(gl_df)
                         }
 
-                        # Save to file
-                        save_reconciliation_state(session_id, st.session_state.reconciliation_state)
+                        # Persist just this account's entry
+                        save_account_state(session_id, account, st.session_state.reconciliation_state[account])
 
                         # Auto-save session
                         if st.session_state.current_session_id:
@@ -613,13 +1012,14 @@ Transactions: {len(gl_df)}
                         "role": "user",
                         "content": user_input
                     })
+                    with st.chat_message("user"):
+                        st.markdown(user_input)
 
                     # Get GL context
                     gl_context = processor.format_gl_for_claude(gl_df, account)
 
-                    # Build messages for Claude
-                    from anthropic import Anthropic
-                    client = Anthropic(api_key=api_key)
+                    # Build messages for Claude (shared client and connection pool)
+                    client = claude_client.get_client(api_key)
 
                     system_prompt = f"""You are a financial analysis assistant. You have access to GL transaction data for account {account}.
 
@@ -634,23 +1034,23 @@ GL Transactions:
 
 Answer questions about these transactions clearly and concisely. Use actual data to support your answers."""
 
-                    # Prepare messages
-                    api_messages = []
-                    for msg in st.session_state[chat_key]:
-                        api_messages.append({
-                            "role": msg["role"],
-                            "content": msg["content"]
-                        })
-
-                    # Get response
-                    response = client.messages.create(
-                        model="claude-sonnet-4-5-20250929",
-                        max_tokens=2048,
-                        system=system_prompt,
-                        messages=api_messages
-                    )
-
-                    assistant_response = response.content[0].text
+                    # Stream the reply into the page as it is generated; write_stream
+                    # returns the full text, so no rerun is needed to show it
+                    with st.chat_message("assistant"):
+                        assistant_response = st.write_stream(claude_client.stream_messages(
+                            client,
+                            model="claude-sonnet-4-5-20250929",
+                            max_tokens=2048,
+                            # The account + GL system block is identical on every turn, so it is
+                            # cached and later questions only pay for the conversation
+                            system=[{
+                                "type": "text",
+                                "text": system_prompt,
+                                "cache_control": {"type": "ephemeral"}
+                            }],
+                            # History entries are already API-shaped {"role", "content"} dicts
+                            messages=st.session_state[chat_key]
+                        ))
 
                     # Add assistant response
                     st.session_state[chat_key].append({
@@ -658,8 +1058,6 @@ Answer questions about these transactions clearly and concisely. Use actual data
                         "content": assistant_response
                     })
 
-                    st.rerun()
-
         except Exception as e:
             st.error(f"Error parsing GL dump: {str(e)}")
 
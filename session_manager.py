@@ -10,59 +10,178 @@ import json
 import pickle
 import base64
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 import io
 import os
 import hashlib
-import glob
+import struct
+import tempfile
+import threading
+import atexit
+import zlib
+import pyarrow as pa
+from pyarrow import feather
+
+# Session files are a binary container: magic + header length, a JSON header (metadata,
+# small fields and a blob index), then the DataFrame and Excel payloads as raw bytes.
+# The header is JSON rather than pickle because session files can be uploaded by users.
+SESSION_MAGIC = b'BSBS'
+SESSION_VERSION = '2.0'
+SESSION_EXT = '.bsb'
+_PREAMBLE = struct.Struct('<4sI')
+DATAFRAME_KEYS = ('classification_df', 'tb_merged')
+
+# Session state entries saved to and restored from session files
+SESSION_KEYS = (
+    'classification_df', 'tb_merged', 'classification_result', 'reconciliation_result',
+    'excel_output', 'reconciliation_state', 'analysis_complete'
+)
+
+
+def _encode_dataframe(key: str, df: pd.DataFrame) -> tuple:
+    """
+    Encode a DataFrame as LZ4-compressed Feather, falling back to JSON for frames Arrow cannot type.
+    Encoded once per DataFrame object and kept in session_state: the results view re-exports the
+    session on every rerun, and stored frames are replaced rather than mutated.
+    """
+    encoded_frames = st.session_state.get('encoded_frames')
+    if encoded_frames is None:
+        encoded_frames = st.session_state.encoded_frames = {}
+    cached = encoded_frames.get(key)
+    if cached is None or cached[0] is not df:
+        cached = encoded_frames[key] = (df, *_encode_dataframe_uncached(df))
+    return cached[1:]
 
 
-def export_session() -> bytes:
+def _encode_dataframe_uncached(df: pd.DataFrame) -> tuple:
+    """(kind, blob) for a DataFrame: 'feather', or zlib-compressed 'json' when Arrow cannot type a column."""
+    try:
+        sink = pa.BufferOutputStream()
+        feather.write_feather(df, sink, compression='lz4')
+        return 'feather', sink.getvalue().to_pybytes()
+    except (pa.ArrowInvalid, pa.ArrowTypeError, ValueError):
+        # e.g. object columns mixing numbers and strings
+        return 'json.zlib', zlib.compress(df.to_json(orient='split').encode('utf-8'), 1)
+
+
+def pack_session(session_data: Dict[str, Any]) -> bytes:
     """
-    Export current session state to a downloadable file.
-    Returns serialized session data as bytes.
+    Serialize session data into the binary session format.
+    DataFrames and bytes values in session_data['data'] become blobs; everything else stays in the header.
     """
-    session_data = {
-        'export_timestamp': datetime.now().isoformat(),
-        'version': '1.0',
-        'data': {}
-    }
+    return b''.join(_pack_session_parts(session_data))
+
+
+def _pack_session_parts(session_data: Dict[str, Any]) -> List[bytes]:
+    """The pieces of a packed session in file order, for writing without joining them first."""
+    header = {key: value for key, value in session_data.items() if key != 'data'}
+    header['data'] = {}
+    header['blobs'] = {}
+    # Counts for get_session_summary, so it can read them without decoding any blob
+    header['meta'] = {}
+    payloads = []
+    offset = 0
+    for key, value in session_data['data'].items():
+        if isinstance(value, pd.DataFrame):
+            kind, blob = _encode_dataframe(key, value)
+            header['meta'][f'{key}_rows'] = len(value)
+        elif isinstance(value, bytes):
+            kind, blob = 'bytes', value
+        else:
+            header['data'][key] = value
+            continue
+        header['blobs'][key] = [kind, offset, len(blob)]
+        payloads.append(blob)
+        offset += len(blob)
 
-    # Save classification DataFrame
-    if 'classification_df' in st.session_state and st.session_state.classification_df is not None:
-        session_data['data']['classification_df'] = st.session_state.classification_df.to_json(orient='split')
+    recon_state = session_data['data'].get('reconciliation_state')
+    if recon_state is not None:
+        header['meta']['reconciled_count'] = sum(1 for acc in recon_state.values() if acc.get('reconciled', False))
 
-    # Save trial balance DataFrame
-    if 'tb_merged' in st.session_state and st.session_state.tb_merged is not None:
-        session_data['data']['tb_merged'] = st.session_state.tb_merged.to_json(orient='split')
+    header_bytes = json.dumps(header).encode('utf-8')
+    return [_PREAMBLE.pack(SESSION_MAGIC, len(header_bytes)), header_bytes, *payloads]
+
+
+def unpack_session(raw: bytes) -> Dict[str, Any]:
+    """
+    Parse a session file (binary format or legacy JSON) into session data
+    with DataFrames and Excel bytes already decoded.
+    """
+    if raw[:len(SESSION_MAGIC)] != SESSION_MAGIC:
+        return _decode_legacy_session(json.loads(raw))
+
+    session_data = read_session_header(raw)
+    payloads = memoryview(raw)[_PREAMBLE.size + _PREAMBLE.unpack_from(raw)[1]:]
 
-    # Save classification result text
-    if 'classification_result' in st.session_state:
-        session_data['data']['classification_result'] = st.session_state.classification_result
+    data = session_data['data']
+    for key, (kind, offset, length) in session_data.pop('blobs', {}).items():
+        blob = payloads[offset:offset + length]
+        if kind == 'feather':
+            data[key] = feather.read_feather(pa.BufferReader(pa.py_buffer(blob)))
+        elif kind == 'json.zlib':
+            data[key] = pd.read_json(io.StringIO(zlib.decompress(blob).decode('utf-8')), orient='split')
+        else:
+            data[key] = bytes(blob)
+    return session_data
 
-    # Save reconciliation result text
-    if 'reconciliation_result' in st.session_state:
-        session_data['data']['reconciliation_result'] = st.session_state.reconciliation_result
 
-    # Save Excel output
-    if 'excel_output' in st.session_state and st.session_state.excel_output is not None:
-        excel_data = st.session_state.excel_output
-        # Handle BytesIO objects
-        if hasattr(excel_data, 'getvalue'):
-            excel_data = excel_data.getvalue()
-        session_data['data']['excel_output'] = base64.b64encode(excel_data).decode('utf-8')
+def read_session_header(raw: bytes) -> Dict[str, Any]:
+    """
+    Parse only the header of a session file: metadata, small fields and the blob index.
+    Legacy JSON files have no separate header and are decoded in full.
+    """
+    if raw[:len(SESSION_MAGIC)] != SESSION_MAGIC:
+        return _decode_legacy_session(json.loads(raw))
+    _, header_len = _PREAMBLE.unpack_from(raw)
+    return json.loads(raw[_PREAMBLE.size:_PREAMBLE.size + header_len])
+
+
+def _decode_legacy_session(session_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Decode the JSON-string DataFrames and base64 Excel of a version 1.0 session file."""
+    data = session_data.get('data', {})
+    for key in DATAFRAME_KEYS:
+        if key in data:
+            data[key] = pd.read_json(io.StringIO(data[key]), orient='split')
+    if 'excel_output' in data:
+        data['excel_output'] = base64.b64decode(data['excel_output'].encode('utf-8'))
+    return session_data
+
+
+def _collect_session_data() -> Dict[str, Any]:
+    """Values of SESSION_KEYS to save; unset and None entries are left out."""
+    data = {}
+    for key in SESSION_KEYS:
+        value = st.session_state.get(key)
+        if value is None:
+            continue
+        if key == 'excel_output':
+            # Handle BytesIO objects
+            value = bytes(value.getvalue() if hasattr(value, 'getvalue') else value)
+        data[key] = value
+    return data
+
+
+def _restore_session_data(data: Dict[str, Any]):
+    """Copy saved SESSION_KEYS values back into session state."""
+    for key in SESSION_KEYS:
+        if key in data:
+            st.session_state[key] = data[key]
+    if 'analysis_complete' not in data:
+        st.session_state.analysis_complete = True  # If we have data, analysis was complete
 
-    # Save reconciliation state (which accounts are reconciled)
-    if 'reconciliation_state' in st.session_state:
-        session_data['data']['reconciliation_state'] = st.session_state.reconciliation_state
 
-    # Save analysis completion flag
-    if 'analysis_complete' in st.session_state:
-        session_data['data']['analysis_complete'] = st.session_state.analysis_complete
+def export_session() -> bytes:
+    """
+    Export current session state to a downloadable file.
+    Returns serialized session data as bytes.
+    """
+    session_data = {
+        'export_timestamp': datetime.now().isoformat(),
+        'version': SESSION_VERSION,
+        'data': _collect_session_data()
+    }
 
-    # Serialize to JSON
-    json_str = json.dumps(session_data, indent=2)
-    return json_str.encode('utf-8')
+    return pack_session(session_data)
 
 
 def import_session(uploaded_file) -> bool:
@@ -71,46 +190,15 @@ def import_session(uploaded_file) -> bool:
     Returns True if successful, False otherwise.
     """
     try:
-        # Read the uploaded file
-        session_data = json.load(uploaded_file)
+        # Read the uploaded file (binary or legacy JSON session)
+        session_data = unpack_session(uploaded_file.read())
 
         # Verify version
         if 'version' not in session_data or 'data' not in session_data:
             st.error("Invalid session file format")
             return False
 
-        data = session_data['data']
-
-        # Restore classification DataFrame
-        if 'classification_df' in data:
-            st.session_state.classification_df = pd.read_json(io.StringIO(data['classification_df']), orient='split')
-
-        # Restore trial balance DataFrame
-        if 'tb_merged' in data:
-            st.session_state.tb_merged = pd.read_json(io.StringIO(data['tb_merged']), orient='split')
-
-        # Restore classification result text
-        if 'classification_result' in data:
-            st.session_state.classification_result = data['classification_result']
-
-        # Restore reconciliation result text
-        if 'reconciliation_result' in data:
-            st.session_state.reconciliation_result = data['reconciliation_result']
-
-        # Restore Excel output
-        if 'excel_output' in data:
-            st.session_state.excel_output = base64.b64decode(data['excel_output'].encode('utf-8'))
-
-        # Restore reconciliation state
-        if 'reconciliation_state' in data:
-            st.session_state.reconciliation_state = data['reconciliation_state']
-
-        # Restore analysis completion flag
-        if 'analysis_complete' in data:
-            st.session_state.analysis_complete = data['analysis_complete']
-        else:
-            st.session_state.analysis_complete = True  # If we have data, analysis was complete
-
+        _restore_session_data(session_data['data'])
         return True
 
     except Exception as e:
@@ -120,21 +208,26 @@ def import_session(uploaded_file) -> bool:
 
 def get_session_summary(session_data: Dict[str, Any]) -> str:
     """
-    Generate a summary of what's in a session file.
+    Generate a summary of what's in a session file (as returned by read_session_header or unpack_session).
+    Binary session files carry the counts in their header meta, so no DataFrame is decoded.
     """
     if 'data' not in session_data:
         return "Invalid session file"
 
     data = session_data['data']
+    meta = session_data.get('meta', {})
     summary_parts = []
 
     # Count accounts
-    if 'classification_df' in data:
-        df = pd.read_json(io.StringIO(data['classification_df']), orient='split')
-        summary_parts.append(f"📊 {len(df)} accounts")
+    if 'classification_df_rows' in meta:
+        summary_parts.append(f"📊 {meta['classification_df_rows']} accounts")
+    elif 'classification_df' in data:
+        summary_parts.append(f"📊 {len(data['classification_df'])} accounts")
 
     # Check reconciliation progress
-    if 'reconciliation_state' in data:
+    if 'reconciled_count' in meta:
+        summary_parts.append(f"✓ {meta['reconciled_count']} accounts reconciled")
+    elif 'reconciliation_state' in data:
         recon_state = data['reconciliation_state']
         reconciled_count = sum(1 for acc in recon_state.values() if acc.get('reconciled', False))
         summary_parts.append(f"✓ {reconciled_count} accounts reconciled")
@@ -161,11 +254,11 @@ def generate_session_id() -> str:
     """
     # Create a hash from TB data if available
     if 'tb_merged' in st.session_state and st.session_state.tb_merged is not None:
-        tb_hash = hashlib.md5(
-            st.session_state.tb_merged.to_json().encode()
-        ).hexdigest()[:8]
+        # Hash the encoded TB blob that the save is about to write anyway
+        _, tb_blob = _encode_dataframe('tb_merged', st.session_state.tb_merged)
+        tb_hash = hashlib.blake2b(tb_blob, digest_size=4).hexdigest()
     else:
-        tb_hash = hashlib.md5(str(datetime.now()).encode()).hexdigest()[:8]
+        tb_hash = hashlib.blake2b(str(datetime.now()).encode(), digest_size=4).hexdigest()
 
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     return f"session_{tb_hash}_{timestamp}"
@@ -176,6 +269,109 @@ def ensure_sessions_dir():
     os.makedirs(SESSIONS_DIR, exist_ok=True)
 
 
+def _save_fingerprint(session_id: str, data: Dict[str, Any]) -> tuple:
+    """
+    What a save would write, minus the timestamp. DataFrames and bytes are held by identity
+    (they are replaced, never mutated); everything else by its JSON text, since
+    reconciliation_state is updated in place.
+    """
+    blobs = tuple((key, value) for key, value in data.items() if isinstance(value, (pd.DataFrame, bytes)))
+    fields = {key: value for key, value in data.items() if not isinstance(value, (pd.DataFrame, bytes))}
+    return session_id, blobs, json.dumps(fields, sort_keys=True)
+
+
+def _same_save(a: tuple, b: tuple) -> bool:
+    """Whether two save fingerprints describe the same file contents."""
+    return (
+        a[0] == b[0] and a[2] == b[2] and len(a[1]) == len(b[1])
+        and all(key_a == key_b and value_a is value_b for (key_a, value_a), (key_b, value_b) in zip(a[1], b[1]))
+    )
+
+
+def _atomic_write(path: str, parts: List[bytes]):
+    """
+    Write parts to a temporary file next to path, then rename it over path, so an
+    interrupted save never leaves a truncated session behind.
+    Blobs are written straight from the cached encodings rather than joined into one copy.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='session_', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.writelines(parts)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+# Auto-save files are written by one background thread so the rerun does not wait on disk.
+# Pending writes are keyed by path: a newer save of a session replaces one not yet written.
+_pending_writes: Dict[str, List[bytes]] = {}
+_writing_path: Optional[str] = None
+# Paths whose last background write failed; auto-save never skips these as unchanged
+_failed_writes = set()
+# Longest auto_load_session waits for a queued write of the file it is about to read
+WRITE_WAIT_TIMEOUT = 10.0
+_writes_changed = threading.Condition()
+_writer_thread: Optional[threading.Thread] = None
+
+
+def _writer_loop():
+    """Background writer: take pending session writes one at a time and write them atomically."""
+    global _writing_path
+    while True:
+        with _writes_changed:
+            while not _pending_writes:
+                _writes_changed.wait()
+            path, parts = _pending_writes.popitem()
+            _writing_path = path
+        failed = False
+        try:
+            _atomic_write(path, parts)
+        except Exception:
+            failed = True  # Silently fail - the next auto-save of this session writes it again
+        finally:
+            with _writes_changed:
+                if failed:
+                    _failed_writes.add(path)
+                else:
+                    _failed_writes.discard(path)
+                _writing_path = None
+                _writes_changed.notify_all()
+
+
+def _queue_write(path: str, parts: List[bytes]):
+    """Hand a session file to the background writer, starting it on first use."""
+    global _writer_thread
+    with _writes_changed:
+        _pending_writes[path] = parts
+        if _writer_thread is None:
+            _writer_thread = threading.Thread(target=_writer_loop, name='session-writer', daemon=True)
+            _writer_thread.start()
+        _writes_changed.notify_all()
+
+
+def _wait_for_write(path: str, timeout: float = WRITE_WAIT_TIMEOUT):
+    """Block until no write of path is pending or in progress, or until timeout seconds pass."""
+    with _writes_changed:
+        _writes_changed.wait_for(lambda: path not in _pending_writes and _writing_path != path, timeout)
+
+
+@atexit.register
+def _flush_pending_writes():
+    """Write whatever is still queued when the server shuts down (the writer thread is a daemon)."""
+    with _writes_changed:
+        pending = list(_pending_writes.items())
+        _pending_writes.clear()
+    for path, parts in pending:
+        try:
+            _atomic_write(path, parts)
+        except Exception:
+            pass
+
+
 def auto_save_session(session_id: Optional[str] = None) -> str:
     """
     Automatically save current session to server file.
@@ -187,44 +383,28 @@ def auto_save_session(session_id: Optional[str] = None) -> str:
     if session_id is None:
         session_id = generate_session_id()
 
+    data = _collect_session_data()
+    session_file = os.path.join(SESSIONS_DIR, f"{session_id}{SESSION_EXT}")
+
+    # Skip the write when nothing has changed since this session's last save, unless that
+    # save's background write failed (the file on disk would then be an older version)
+    fingerprint = _save_fingerprint(session_id, data)
+    last_save = st.session_state.get('last_session_save')
+    if (last_save is not None and _same_save(last_save, fingerprint)
+            and os.path.exists(session_file) and session_file not in _failed_writes):
+        return session_id
+
     # Get session data
     session_data = {
         'export_timestamp': datetime.now().isoformat(),
-        'version': '1.0',
+        'version': SESSION_VERSION,
         'session_id': session_id,
-        'data': {}
+        'data': data
     }
 
-    # Save all session state data
-    if 'classification_df' in st.session_state and st.session_state.classification_df is not None:
-        session_data['data']['classification_df'] = st.session_state.classification_df.to_json(orient='split')
-
-    if 'tb_merged' in st.session_state and st.session_state.tb_merged is not None:
-        session_data['data']['tb_merged'] = st.session_state.tb_merged.to_json(orient='split')
-
-    if 'classification_result' in st.session_state:
-        session_data['data']['classification_result'] = st.session_state.classification_result
-
-    if 'reconciliation_result' in st.session_state:
-        session_data['data']['reconciliation_result'] = st.session_state.reconciliation_result
-
-    if 'excel_output' in st.session_state and st.session_state.excel_output is not None:
-        excel_data = st.session_state.excel_output
-        # Handle BytesIO objects
-        if hasattr(excel_data, 'getvalue'):
-            excel_data = excel_data.getvalue()
-        session_data['data']['excel_output'] = base64.b64encode(excel_data).decode('utf-8')
-
-    if 'reconciliation_state' in st.session_state:
-        session_data['data']['reconciliation_state'] = st.session_state.reconciliation_state
-
-    if 'analysis_complete' in st.session_state:
-        session_data['data']['analysis_complete'] = st.session_state.analysis_complete
-
     # Save to file
-    session_file = os.path.join(SESSIONS_DIR, f"{session_id}.json")
-    with open(session_file, 'w') as f:
-        json.dump(session_data, f)
+    _queue_write(session_file, _pack_session_parts(session_data))
+    st.session_state.last_session_save = fingerprint
 
     return session_id
 
@@ -235,44 +415,23 @@ def auto_load_session(session_id: str) -> bool:
     Returns True if successful, False otherwise.
     """
     try:
-        session_file = os.path.join(SESSIONS_DIR, f"{session_id}.json")
+        session_file = os.path.join(SESSIONS_DIR, f"{session_id}{SESSION_EXT}")
+        _wait_for_write(session_file)
+        if not os.path.exists(session_file):
+            # Sessions saved before the binary format
+            session_file = os.path.join(SESSIONS_DIR, f"{session_id}.json")
 
         if not os.path.exists(session_file):
             return False
 
-        with open(session_file, 'r') as f:
-            session_data = json.load(f)
+        with open(session_file, 'rb') as f:
+            session_data = unpack_session(f.read())
 
         # Verify version
         if 'version' not in session_data or 'data' not in session_data:
             return False
 
-        data = session_data['data']
-
-        # Restore all session state
-        if 'classification_df' in data:
-            st.session_state.classification_df = pd.read_json(io.StringIO(data['classification_df']), orient='split')
-
-        if 'tb_merged' in data:
-            st.session_state.tb_merged = pd.read_json(io.StringIO(data['tb_merged']), orient='split')
-
-        if 'classification_result' in data:
-            st.session_state.classification_result = data['classification_result']
-
-        if 'reconciliation_result' in data:
-            st.session_state.reconciliation_result = data['reconciliation_result']
-
-        if 'excel_output' in data:
-            st.session_state.excel_output = base64.b64decode(data['excel_output'].encode('utf-8'))
-
-        if 'reconciliation_state' in data:
-            st.session_state.reconciliation_state = data['reconciliation_state']
-
-        if 'analysis_complete' in data:
-            st.session_state.analysis_complete = data['analysis_complete']
-        else:
-            st.session_state.analysis_complete = True
-
+        _restore_session_data(session_data['data'])
         return True
 
     except Exception as e:
@@ -282,16 +441,21 @@ def auto_load_session(session_id: str) -> bool:
 
 def cleanup_old_sessions(days: int = 7):
     """
-    Delete session files older than specified days.
+    Delete session files (and temp files left by an interrupted save) older than specified days.
     """
     try:
         ensure_sessions_dir()
-        cutoff_date = datetime.now() - timedelta(days=days)
-
-        for session_file in glob.glob(os.path.join(SESSIONS_DIR, "session_*.json")):
-            file_time = datetime.fromtimestamp(os.path.getmtime(session_file))
-            if file_time < cutoff_date:
-                os.remove(session_file)
+        cutoff = (datetime.now() - timedelta(days=days)).timestamp()
+
+        # One directory scan; each entry is stat'ed once through its DirEntry
+        with os.scandir(SESSIONS_DIR) as entries:
+            expired = [
+                entry.path for entry in entries
+                if entry.name.startswith('session_') and entry.name.endswith((SESSION_EXT, '.json', '.tmp'))
+                and entry.stat().st_mtime < cutoff
+            ]
+        for session_file in expired:
+            os.remove(session_file)
     except Exception:
         pass  # Silently fail - cleanup is not critical
 
@@ -301,14 +465,8 @@ def get_session_id_from_url() -> Optional[str]:
     Get session ID from URL query parameters.
     """
     try:
-        query_params = st.query_params
-        # Handle both dict-like access and attribute access
-        if hasattr(query_params, 'get'):
-            return query_params.get('session_id', None)
-        elif 'session_id' in query_params:
-            return query_params['session_id']
-        else:
-            return None
+        # st.query_params is a dict-like proxy in every Streamlit version this app supports
+        return st.query_params.get('session_id')
     except Exception:
         return None
 